@@ -11,8 +11,14 @@
 
 from CvPythonExtensions import *
 import CvMapGeneratorUtil
+import array
+import gc
 import math
+import os
+import struct
 import sys
+import time
+import zlib
 
 # Global values that determine how the MapScript works.
 
@@ -71,6 +77,123 @@ Fractal used to introduce random variations to feature types depending on their
 """
 
 
+terrainLatitudes = None
+"""
+Rows of the latitude of each plot used for terrain types, calculated from terrainVarFractal (see getLatitudeRows).
+"""
+
+
+featuresLatitudes = None
+"""
+Rows of the latitude of each plot used for feature types, calculated from featuresVarFractal (see getLatitudeRows).
+"""
+
+
+lMapAreas = list()
+"""
+List of all map area polygons generated for the current map, in generation order.
+"""
+
+
+fMinStartingLandmassFraction = 0.2
+"""
+The largest landmass inside of each region in which civilizations can start must cover at least this fraction of the
+region. Otherwise, the region is generated again.
+"""
+
+
+iMaxRegionRetries = 3
+"""
+Maximum number of times that a region in which civilizations can start is generated again when it is not valid.
+"""
+
+
+iGenerationSeed = -1
+"""
+If it is zero or greater, plot types are generated with random number generators initialized with this seed instead of
+the map random number generator. Seeds that pass the checks of screenSeed can be generated at full size this way.
+"""
+
+
+fScreeningScale = 0.25
+"""
+Default scale of the grid used by screenSeed, with regard to the size of the map.
+"""
+
+
+bSharedDisplacementFields = False
+"""
+If True, all polygonal regions share a single pair of displacement fractals covering the whole map, instead of
+creating their own pair. This saves time and memory, and makes coastlines continuous where regions touch. It changes
+the map generated from a given seed, so it is disabled by default.
+"""
+
+
+sharedDisplacementFractals = None
+"""
+Shared displacement fractals of the current map, as a tuple with the width and height of their grid and the horizontal
+and vertical displacement fractals. See bSharedDisplacementFields.
+"""
+
+
+iMinStartingRimDistance = 0
+"""
+If it is greater than zero, civilizations cannot start closer than this distance to the Rim of the disc. It changes the
+starting plots of a given seed, so it is disabled by default.
+"""
+
+
+distanceFields = None
+"""
+Distance fields of the current map (see DiscworldDistanceFields). They are created after generating the plot types.
+"""
+
+
+bPrintMapPreview = False
+"""
+If True, ASCII previews of the plot types, the regions, the latitude fields and the variation fractals are printed to
+the log during map generation.
+"""
+
+
+sMapPreviewDirectory = None
+"""
+If set to the path of an existing directory, the map previews are also saved in it as PNG images.
+"""
+
+
+bProfileGeneration = False
+"""
+If True, the time spent generating each region is measured, printed to the log and added to the map previews.
+"""
+
+
+dRegionTimings = dict()
+"""
+Time in seconds spent generating each region of the current map, indexed by region name. Only filled when
+bProfileGeneration is True.
+"""
+
+
+dLegendFont = {
+	" ": (0, 0, 0, 0, 0), ".": (0, 0, 0, 0, 2), ",": (0, 0, 0, 2, 4), ":": (0, 2, 0, 2, 0), "-": (0, 0, 7, 0, 0),
+	"(": (1, 2, 2, 2, 1), ")": (4, 2, 2, 2, 4),
+	"0": (7, 5, 5, 5, 7), "1": (2, 6, 2, 2, 7), "2": (6, 1, 2, 4, 7), "3": (6, 1, 2, 1, 6), "4": (5, 5, 7, 1, 1),
+	"5": (7, 4, 6, 1, 6), "6": (3, 4, 7, 5, 7), "7": (7, 1, 2, 2, 2), "8": (7, 5, 7, 5, 7), "9": (7, 5, 7, 1, 6),
+	"A": (2, 5, 7, 5, 5), "B": (6, 5, 6, 5, 6), "C": (3, 4, 4, 4, 3), "D": (6, 5, 5, 5, 6), "E": (7, 4, 6, 4, 7),
+	"F": (7, 4, 6, 4, 4), "G": (3, 4, 5, 5, 3), "H": (5, 5, 7, 5, 5), "I": (7, 2, 2, 2, 7), "J": (1, 1, 1, 5, 2),
+	"K": (5, 5, 6, 5, 5), "L": (4, 4, 4, 4, 7), "M": (5, 7, 7, 5, 5), "N": (6, 5, 5, 5, 5), "O": (2, 5, 5, 5, 2),
+	"P": (6, 5, 6, 4, 4), "Q": (2, 5, 5, 6, 3), "R": (6, 5, 6, 5, 5), "S": (3, 4, 2, 1, 6), "T": (7, 2, 2, 2, 2),
+	"U": (5, 5, 5, 5, 7), "V": (5, 5, 5, 5, 2), "W": (5, 5, 7, 7, 5), "X": (5, 5, 2, 5, 5), "Y": (5, 5, 2, 2, 2),
+	"Z": (7, 1, 2, 4, 7),
+}
+"""
+Font used to draw the legend of the PNG map previews. Each character is 3 pixels wide and 5 pixels high, and each
+value is a row of the character from top to bottom, with the leftmost pixel in the highest bit. Lowercase letters are
+drawn as uppercase, and unknown characters as spaces.
+"""
+
+
 def isAdvancedMap():
 	"""
 	This map should not show up in simple mode.
@@ -134,7 +257,8 @@ def getWrapY():
 
 def isBonusIgnoreLatitude():
 	"""
-	The latitude calculations made in Civilization IV are not appropiate for placing bonuses on a flat disc.
+	The latitude calculations made in Civilization IV are not appropiate for placing bonuses on a flat disc. The
+	latitude of each bonus is checked by DiscworldBonusGenerator instead.
 	:return:
 	"""
 	return True
@@ -148,14 +272,25 @@ def generatePlotTypes():
 	"""
 	print "[DISCWORLD] -- generatePlotTypes()"
 
-	plotGenerator = DiscworldMultilayeredFractal()
+	global distanceFields
+	distanceFields = None
+
+	if iGenerationSeed >= 0:
+		fracDice, layoutDice = getSeededDice(iGenerationSeed)
+		plotGenerator = DiscworldMultilayeredFractal(fracDice = fracDice, layoutDice = layoutDice)
+	else:
+		plotGenerator = DiscworldMultilayeredFractal()
 	plotTypes = plotGenerator.generatePlotsByRegion()
 
 	# Create Discworld border first pass: water.
-	for iX in range(map.getGridWidth()):
-		for iY in range(map.getGridHeight()):
-			if isOutsideDisc(iX, iY):
-				plotTypes[iY * map.getGridWidth() + iX] = PlotTypes.PLOT_OCEAN
+	removeLandOutsideDisc(plotTypes, map.getGridWidth(), map.getGridHeight())
+
+	distanceFields = DiscworldDistanceFields(plotTypes, map.getGridWidth(), map.getGridHeight())
+
+	if isMapPreviewEnabled():
+		previewPlotTypes(plotTypes, map.getGridWidth(), map.getGridHeight())
+		for mapArea in lMapAreas:
+			previewMapArea(mapArea)
 
 	return plotTypes
 
@@ -169,10 +304,16 @@ def generateTerrainTypes():
 	print "[DISCWORLD] -- generateTerrainTypes()"
 
 	global terrainVarFractal
+	global terrainLatitudes
 	terrainVarFractal = getVariationFractal(iTerrainGrain)
+	terrainLatitudes = getLatitudeRows(terrainVarFractal)
 	terrainGen = DiscworldTerrainGenerator(fSnowLatitude = 1.0 - fSnowRadius, fTundraLatitude = 1.0 - fTundraRadius)
 	terrainTypes = terrainGen.generateTerrain()
 
+	if isMapPreviewEnabled():
+		previewFractal("Terrain variation fractal", terrainVarFractal)
+		previewLatitude("Terrain latitude", terrainLatitudes)
+
 	return terrainTypes
 
 
@@ -194,30 +335,40 @@ def addFeatures():
 
 	# Add other features.
 	global featuresVarFractal
+	global featuresLatitudes
 	featuresVarFractal = getVariationFractal(iFeatureGrain)
+	featuresLatitudes = getLatitudeRows(featuresVarFractal)
 	featureGen = DiscworldFeatureGenerator()
 	featureGen.addFeatures()
 
+	if isMapPreviewEnabled():
+		previewFractal("Features variation fractal", featuresVarFractal)
+		previewLatitude("Features latitude", featuresLatitudes)
+
+	return 0
+
+
+def addBonuses():
+	"""
+	Places all bonuses of the map. See DiscworldBonusGenerator for details.
+	:return: 0
+	"""
+	print "[DISCWORLD] -- addBonuses()"
+
+	bonusGen = DiscworldBonusGenerator()
+	bonusGen.addBonuses()
+
 	return 0
 
 
 def findStartingPlot(argsList):
 	"""
 	Find starting plot for a certain player. Civilizations are only allowed to start in the main continent or in the
-	counterweight continent.
+	counterweight continent. See isInsidePlayableRegion.
 	:param argsList: List that contains the playerID of the player.
 	:return: Starting plot
 	"""
 	[playerID] = argsList
-
-	def isInsidePlayableRegion(pID, iX, iY):
-		global lStartingPlotAreas
-		for mapAreaPolygon in lStartingPlotAreas:
-			if mapAreaPolygon.isInside(iX, iY):
-				return True
-
-		return False
-
 	return CvMapGeneratorUtil.findStartingPlot(playerID, isInsidePlayableRegion)
 
 
@@ -232,29 +383,99 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 	Along with MapAreaPolygon, this implementation of MultilayeredFractal allows to place regions with arbitrary
 	polygonal shapes, and to rotate them along the center of the disc for any angle. These shapes are distorted and
 	randomized slightly to make them appear more natural (see MapAreaPolygon).
+
+	The generator can also work on a grid scaled down from the size of the map. The choices that define the position and
+	shape of each region are taken from a separate random number generator, so a scaled down generation keeps the same
+	region geometry and angles as a full size one with the same seeds. See screenSeed.
 	"""
 
 
+	def __init__(self, fScale = 1.0, fracDice = None, layoutDice = None, iMaxRetries = -1):
+		"""
+		Initializes the generator.
+		:param fScale: Scale of the generated grid with regard to the size of the map.
+		:param fracDice: Random number generator used for all fractals. By default, the map one.
+		:param layoutDice: Random number generator used for the position and shape of the regions. By default, the map
+		one.
+		:param iMaxRetries: Maximum number of times that a region in which civilizations can start is generated again
+		when it is not valid. By default, iMaxRegionRetries.
+		"""
+		CvMapGeneratorUtil.MultilayeredFractal.__init__(self)
+
+		self.fScale = fScale
+		if fScale != 1.0:
+			self.iW = max(1, int(round(self.iW * fScale)))
+			self.iH = max(1, int(round(self.iH * fScale)))
+			self.wholeworldPlotTypes = [PlotTypes.PLOT_OCEAN] * (self.iW * self.iH)
+		if fracDice is not None:
+			self.dice = fracDice
+		if layoutDice is None:
+			layoutDice = self.dice
+		self.layoutDice = layoutDice
+		if iMaxRetries < 0:
+			iMaxRetries = iMaxRegionRetries
+		self.iMaxRetries = iMaxRetries
+
+
+	def createMapAreaPolygon(self, sRegionName, lPolygonPoints, fAngle):
+		"""
+		Creates a map area polygon in the grid of this generator. See MapAreaPolygon.
+		:param sRegionName: Name of the region.
+		:param lPolygonPoints: List of tuples that contain the x and y coordinates of each of the points.
+		:param fAngle: The polygon will be rotated by this angle.
+		:return: New map area polygon.
+		"""
+		return MapAreaPolygon(
+			sRegionName, lPolygonPoints, fAngle, self.iW, self.iH, self.fScale, self.dice, self.layoutDice,
+			bSharedDisplacementFields
+		)
+
+
 	def generatePlotsByRegion(self):
 		"""
 		Generate all of the regions of the Discworld.
 		:return: Plots generated.
 		"""
-		# Remove all elements from the starting plot areas list.
+		# Remove all elements from the starting plot areas list and from the rest of the lists of the previous map.
 		del lStartingPlotAreas[:]
+		del lMapAreas[:]
+		dRegionTimings.clear()
+		global sharedDisplacementFractals
+		sharedDisplacementFractals = None
 		iBaseSeaLevel = 70 + self.gc.getSeaLevelInfo(self.map.getSeaLevel()).getSeaLevelChange()
 		# Each region of the Discworld has a separate method for creating it.
+		fStartTime = time.clock()
 		self.generatePlotsCentralHub(iBaseSeaLevel)
+		fStartTime = self.recordRegionTiming("Central Hub", fStartTime)
 		# generatePlotsMainContinent also determines the angle in which most of the land will be.
 		fMainAngle = self.generatePlotsMainContinent(iBaseSeaLevel)
+		fStartTime = self.recordRegionTiming("Main Continent", fStartTime)
 		self.generatePlotsCounterweightContinent(iBaseSeaLevel, fMainAngle)
+		fStartTime = self.recordRegionTiming("Counterweight Continent", fStartTime)
 		fIslandsAngle = self.generatePlotsIslands(fMainAngle)
+		fStartTime = self.recordRegionTiming("Islands", fStartTime)
 		# XXXX
 		self.generatePlotsXXXX(iBaseSeaLevel, fIslandsAngle)
+		self.recordRegionTiming("XXXX", fStartTime)
 
 		return self.wholeworldPlotTypes
 
 
+	def recordRegionTiming(self, sRegionName, fStartTime):
+		"""
+		Stores the time spent generating a region in dRegionTimings, if bProfileGeneration is enabled.
+		:param sRegionName: Name of the region.
+		:param fStartTime: Value of time.clock() when the generation of the region started.
+		:return: Value of time.clock() when the timing was recorded, to be used as the start time of the next region.
+		"""
+		fEndTime = time.clock()
+		if bProfileGeneration:
+			dRegionTimings[sRegionName] = fEndTime - fStartTime
+			print "[DISCWORLD] -- %s generated in %.1f ms." % (sRegionName, (fEndTime - fStartTime) * 1000.0)
+
+		return fEndTime
+
+
 	def generatePlotsCentralHub(self, iBaseSeaLevel):
 		"""
 		The central hub is a mountainous region in the center of the disc.
@@ -264,8 +485,8 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		iCentralHubHillsGrain = 1
 
 		# The real center should always be land.
-		iCentralHubCoreSizeX = int(self.iW * fSnowRadius * 0.7)
-		iCentralHubCoreSizeY = int(self.iH * fSnowRadius * 0.7)
+		iCentralHubCoreSizeX = max(1, int(self.iW * fSnowRadius * 0.7))
+		iCentralHubCoreSizeY = max(1, int(self.iH * fSnowRadius * 0.7))
 		iCentralHubCoreWestLon = int((self.iW / 2.0) - int(iCentralHubCoreSizeX / 2.0))
 		iCentralHubCoreSouthLat = int((self.iH / 2.0) - int(iCentralHubCoreSizeY / 2.0))
 		self.generatePlotsInRegion(
@@ -314,7 +535,7 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		iMainContinentHillsGrain = 4
 
 		# Determine the main angle randomly.
-		fMainAngle = math.radians(game.getMapRand().get(360, "[DiscWorld] - Angle of the main continent."))
+		fMainAngle = math.radians(self.layoutDice.get(360, "[DiscWorld] - Angle of the main continent."))
 
 		# Define the area occupied by the main continent.
 		fMiddleX = self.iW / 2.0
@@ -331,13 +552,13 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		]
 
 		# Create the map area polygon.
-		mainContinentMapArea = MapAreaPolygon("Main Continent", lMainContinentPolygon, fMainAngle)
+		mainContinentMapArea = self.createMapAreaPolygon("Main Continent", lMainContinentPolygon, fMainAngle)
 
 		# Add the area to the list of regions in which civilizations can start.
 		global lStartingPlotAreas
 		lStartingPlotAreas.append(mainContinentMapArea)
 
-		self.generatePlotsInMapAreaPolygon(
+		self.generatePlotsInStartingMapAreaPolygon(
 			iBaseSeaLevel - 15, mainContinentMapArea, iMainContinentGrain, iMainContinentHillsGrain, self.iRoundFlags,
 			self.iTerrainFlags, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP
 		)
@@ -357,19 +578,19 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		# The counterweight continent is situated roughly in the opposite direction of the main continent...
 		fCounterAngle = fMainAngle +  math.radians(180)
 		# ... with some randomization, of course. Who wants a predictable world?
-		fCounterAngle += math.radians(game.getMapRand().get(40, "[DiscWorld] - Randomization of the angle of the counterweight continent.") - 20.0)
+		fCounterAngle += math.radians(self.layoutDice.get(40, "[DiscWorld] - Randomization of the angle of the counterweight continent.") - 20.0)
 
 		# Define the area occupied by the counterweight continent.
 		fMiddleX = self.iW / 2.0
 
-		if game.getMapRand().get(2, "[DiscWorld] - Randomization of the angle of the islands.") == 0:
+		if self.layoutDice.get(2, "[DiscWorld] - Randomization of the angle of the islands.") == 0:
 			fLeftDisplacement = self.iW / 7.0
 			fRightDisplacement = self.iW / 10.0
 		else:
 			fLeftDisplacement = self.iW / 10.0
 			fRightDisplacement = self.iW / 7.0
 
-		fPeninsulaWidth = max(4.0, self.iW / 15.0)
+		fPeninsulaWidth = max(4.0 * self.fScale, self.iW / 15.0)
 		fLowestHeight = self.iH / 8.0
 		fBiggestHeight = self.iH / 3.5
 		fPeninsulaHeight = self.iH / 3.0
@@ -388,13 +609,13 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		]
 
 		# Create the map area polygon.
-		counterweightContinentMapArea = MapAreaPolygon("Counterweight Continent", lCounterContPolygon, fCounterAngle)
+		counterweightContinentMapArea = self.createMapAreaPolygon("Counterweight Continent", lCounterContPolygon, fCounterAngle)
 
 		# Add the area to the list of regions in which civilizations can start.
 		global lStartingPlotAreas
 		lStartingPlotAreas.append(counterweightContinentMapArea)
 
-		self.generatePlotsInMapAreaPolygon(
+		self.generatePlotsInStartingMapAreaPolygon(
 			iBaseSeaLevel - 20, counterweightContinentMapArea, iCounterweightContinentGrain,
 			iCounterweightContinentHillsGrain, self.iRoundFlags, self.iTerrainFlags,
 			CyFractal.FracVals.DEFAULT_FRAC_Y_EXP, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP
@@ -413,7 +634,7 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 
 		# The islands may be at the right or at the left of the main continent.
 		fIslandsAngle = fMainAngle
-		if game.getMapRand().get(2, "[DiscWorld] - Randomization of the angle of the islands.") == 0:
+		if self.layoutDice.get(2, "[DiscWorld] - Randomization of the angle of the islands.") == 0:
 			fIslandsAngle += math.radians(90)
 		else:
 			fIslandsAngle -= math.radians(90)
@@ -430,7 +651,7 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		]
 
 		# Create the map area polygon.
-		islandsMapArea = MapAreaPolygon("Islands", lIslandsPolygon, fIslandsAngle)
+		islandsMapArea = self.createMapAreaPolygon("Islands", lIslandsPolygon, fIslandsAngle)
 
 		self.generatePlotsInMapAreaPolygon(
 			90, islandsMapArea, iIslandsGrain, iIslandsHillsGrain, self.iRoundFlags,
@@ -451,7 +672,7 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		iXXXXHillsGrain = 3
 
 		fXXXXAngle = fIslandsAngle +  math.radians(180)
-		fXXXXAngle += math.radians(game.getMapRand().get(20, "[DiscWorld] - XXXX") - 10.0)
+		fXXXXAngle += math.radians(self.layoutDice.get(20, "[DiscWorld] - XXXX") - 10.0)
 
 		fMiddleX = self.iW / 2.0
 
@@ -462,7 +683,7 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 			[fMiddleX - self.iW / 8.0, self.iH / 6.0],
 		]
 
-		xxxxMapArea = MapAreaPolygon("XXXX", lXXXXPolygon, fXXXXAngle)
+		xxxxMapArea = self.createMapAreaPolygon("XXXX", lXXXXPolygon, fXXXXAngle)
 
 		self.generatePlotsInMapAreaPolygon(
 			iBaseSeaLevel, xxxxMapArea, iXXXXGrain, iXXXXHillsGrain, self.iRoundFlags, self.iTerrainFlags,
@@ -470,6 +691,69 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		)
 
 
+	def generatePlotsInStartingMapAreaPolygon(self, iWaterPercent, mapArea, iRegionGrain, iRegionHillsGrain,
+	                                          iRegionPlotFlags, iRegionTerrainFlags, iRegionFracXExp = -1,
+	                                          iRegionFracYExp = -1):
+		"""
+		Generate plots in a polygonal region in which civilizations can start. The largest landmass of the region must
+		cover at least fMinStartingLandmassFraction of it. When this does not happen, only this region is generated
+		again, using new fractals. After self.iMaxRetries failures, the best attempt is kept.
+		If bProfileGeneration is enabled, the time spent validating the region is printed to the log.
+		See generatePlotsInMapAreaPolygon for the description of the parameters.
+		"""
+		fGenerationTime = 0.0
+		fValidationTime = 0.0
+
+		# The region only changes the plots of its bounding box, and the plots inside of it do not depend on the attempt,
+		# so they are obtained only once.
+		fStartTime = time.clock()
+		tAreaPlots = getMapAreaPlots(mapArea, self.iW, self.iH)
+		iMinX, iMinY, iBoxWidth, iBoxHeight = tAreaPlots[:4]
+		lRowStarts = [iY * self.iW + iMinX for iY in range(iMinY, iMinY + iBoxHeight)]
+		lPreviousRows = [self.wholeworldPlotTypes[iStart:iStart + iBoxWidth] for iStart in lRowStarts]
+		lBestRows = None
+		fBestFraction = -1.0
+		fValidationTime += time.clock() - fStartTime
+
+		for iAttempt in range(self.iMaxRetries + 1):
+			if iAttempt > 0:
+				print "[DISCWORLD] -- %s is not valid. Generating it again." % mapArea.sRegionName
+				for iRow in range(iBoxHeight):
+					self.wholeworldPlotTypes[lRowStarts[iRow]:lRowStarts[iRow] + iBoxWidth] = lPreviousRows[iRow]
+
+			fStartTime = time.clock()
+			self.generatePlotsInMapAreaPolygon(
+				iWaterPercent, mapArea, iRegionGrain, iRegionHillsGrain, iRegionPlotFlags, iRegionTerrainFlags,
+				iRegionFracXExp, iRegionFracYExp
+			)
+			fGenerationTime += time.clock() - fStartTime
+
+			fStartTime = time.clock()
+			iAreaPlots, lLandmasses = getMapAreaLandmasses(
+				mapArea, self.wholeworldPlotTypes, self.iW, self.iH, tAreaPlots)
+			fValidationTime += time.clock() - fStartTime
+			fFraction = 0.0
+			if iAreaPlots > 0 and len(lLandmasses) > 0:
+				fFraction = lLandmasses[0] / float(iAreaPlots)
+			print "[DISCWORLD] -- %s: largest landmass covers %d of %d plots (%d landmasses)." % (
+				mapArea.sRegionName, max([0] + lLandmasses), iAreaPlots, len(lLandmasses))
+
+			if fFraction >= fMinStartingLandmassFraction:
+				lBestRows = None
+				break
+			if fFraction > fBestFraction:
+				fBestFraction = fFraction
+				lBestRows = [self.wholeworldPlotTypes[iStart:iStart + iBoxWidth] for iStart in lRowStarts]
+
+		if lBestRows is not None:
+			for iRow in range(iBoxHeight):
+				self.wholeworldPlotTypes[lRowStarts[iRow]:lRowStarts[iRow] + iBoxWidth] = lBestRows[iRow]
+
+		if bProfileGeneration:
+			print "[DISCWORLD] -- %s validated in %.1f ms, %.1f%% of the time spent generating its plots." % (
+				mapArea.sRegionName, fValidationTime * 1000.0, fValidationTime * 100.0 / max(fGenerationTime, 1e-6))
+
+
 	def generatePlotsInMapAreaPolygon(self, iWaterPercent, mapArea, iRegionGrain, iRegionHillsGrain, iRegionPlotFlags,
 	                                  iRegionTerrainFlags, iRegionFracXExp = -1, iRegionFracYExp = -1):
 		"""
@@ -485,15 +769,17 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		:param iRegionFracYExp:
 		:return:
 		"""
+		# Regions generated again keep their original position in the list.
+		if mapArea not in lMapAreas:
+			lMapAreas.append(mapArea)
+
 		# Obtain size and position from the map area.
 		iRegionWidth = mapArea.iRegionWidth
 		iRegionHeight = mapArea.iRegionHeight
 		fMinX = mapArea.fMinX
 		fMinY = mapArea.fMinY
 
-		# Init the plot types array and the regional fractals
-		self.plotTypes = [] # reinit the array for each pass
-		self.plotTypes = [PlotTypes.PLOT_OCEAN] * (iRegionWidth * iRegionHeight)
+		# Init the regional fractals
 		regionContinentsFrac = CyFractal()
 		regionHillsFrac = CyFractal()
 		regionPeaksFrac = CyFractal()
@@ -508,9 +794,15 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 		iHillsTop2 = regionHillsFrac.getHeightFromPercent(min((75 + self.gc.getClimateInfo(self.map.getClimate()).getHillRange()), 100))
 		iPeakThreshold = regionPeaksFrac.getHeightFromPercent(self.gc.getClimateInfo(self.map.getClimate()).getPeakPercent())
 
-		# Loop through the region's plots
+		# Loop through the region's plots. Land plots are applied directly to the global plot array.
 		for iRegionX in range(iRegionWidth):
+			iWholeworldX = int(iRegionX + fMinX)
+			if iWholeworldX < 0 or iWholeworldX > (self.iW - 1):
+				continue
 			for iRegionY in range(iRegionHeight):
+				iWholeworldY = int(iRegionY + fMinY)
+				if iWholeworldY < 0 or iWholeworldY > (self.iH - 1):
+					continue
 				val = regionContinentsFrac.getHeight(iRegionX, iRegionY)
 				if val <= iWaterThreshold:
 					pass
@@ -518,31 +810,16 @@ class DiscworldMultilayeredFractal(CvMapGeneratorUtil.MultilayeredFractal):
 					# Checking if the plot is inside the polygon is expensive, so it is done here at the last possible
 					# chance.
 					if mapArea.isInside(iRegionX + fMinX, iRegionY + fMinY):
-						iPlotIndex = iRegionY * iRegionWidth + iRegionX
+						iWorld = iWholeworldY * self.iW + iWholeworldX
 						hillVal = regionHillsFrac.getHeight(iRegionX, iRegionY)
 						if hillVal >= iHillsBottom1 and hillVal <= iHillsTop1 or hillVal >= iHillsBottom2 and hillVal <= iHillsTop2:
 							peakVal = regionPeaksFrac.getHeight(iRegionX, iRegionY)
 							if peakVal <= iPeakThreshold:
-								self.plotTypes[iPlotIndex] = PlotTypes.PLOT_PEAK
+								self.wholeworldPlotTypes[iWorld] = PlotTypes.PLOT_PEAK
 							else:
-								self.plotTypes[iPlotIndex] = PlotTypes.PLOT_HILLS
+								self.wholeworldPlotTypes[iWorld] = PlotTypes.PLOT_HILLS
 						else:
-							self.plotTypes[iPlotIndex] = PlotTypes.PLOT_LAND
-
-		# Apply the region's plots to the global plot array.
-		for iRegionX in range(iRegionWidth):
-			iWholeworldX = int(iRegionX + fMinX)
-			if iWholeworldX < 0 or iWholeworldX > (self.iW - 1):
-				continue
-			for iRegionY in range(iRegionHeight):
-				iWholeworldY = int(iRegionY + fMinY)
-				if iWholeworldY < 0 or iWholeworldY > (self.iH - 1):
-					continue
-				iPlotIndex = iRegionY * iRegionWidth + iRegionX
-				if self.plotTypes[iPlotIndex] == PlotTypes.PLOT_OCEAN:
-					continue
-				iWorld = iWholeworldY * self.iW + iWholeworldX
-				self.wholeworldPlotTypes[iWorld] = self.plotTypes[iPlotIndex]
+							self.wholeworldPlotTypes[iWorld] = PlotTypes.PLOT_LAND
 
 		# This region is done.
 		return
@@ -563,7 +840,7 @@ class DiscworldTerrainGenerator(CvMapGeneratorUtil.TerrainGenerator):
 		:param iY: y coordinate of the plot.
 		:return: Calculated latitude.
 		"""
-		return getInvertedDistanceToCenter(iX, iY, terrainVarFractal)
+		return terrainLatitudes[iY][iX]
 
 
 class DiscworldFeatureGenerator(CvMapGeneratorUtil.FeatureGenerator):
@@ -582,7 +859,7 @@ class DiscworldFeatureGenerator(CvMapGeneratorUtil.FeatureGenerator):
 		:param iY: y coordinate of the plot.
 		:return: Calculated latitude.
 		"""
-		return getInvertedDistanceToCenter(iX, iY, featuresVarFractal)
+		return featuresLatitudes[iY][iX]
 
 
 	def addIceAtPlot(self, pPlot, iX, iY, lat):
@@ -600,6 +877,457 @@ class DiscworldFeatureGenerator(CvMapGeneratorUtil.FeatureGenerator):
 				pPlot.setFeatureType(self.featureIce, -1)
 
 
+class DiscworldBonusGenerator:
+	"""
+	Bonus generator customized for Discworld. Bonuses are placed according to the same "latitude" used for terrain
+	types, so they follow the climate rings of the disc.
+
+	Instead of checking every plot of the map for every bonus type, the generator builds an index of the plots in a
+	single pass, grouping them by terrain, feature, plot type and latitude ring. Each bonus type then takes random
+	samples from the groups that are compatible with it, and the distance to previously placed bonuses is checked using
+	a grid of buckets. The cost of placing bonuses depends on the number of bonuses instead of the size of the map.
+
+	Bonuses follow the placement rules of Civilization IV, with these differences:
+	- The area of bonuses that must be placed in a single area is the area of the first plot that can have the bonus,
+	  instead of the area with the fewest unique bonuses.
+	- Bonuses of the same type are kept apart by the unique range of the type, but not by the unique range of their
+	  class.
+	- Bonuses placed in a group around another bonus are not kept apart by the unique range of their type, so that
+	  groups can be formed.
+	- Each bonus type takes a limited number of samples, so fewer bonuses than requested can be placed when most of
+	  the compatible plots are not valid.
+	"""
+
+	__RING_SIZE = 10
+	"""
+	Degrees of latitude covered by each latitude ring of the index.
+	"""
+
+
+	__BUCKET_SIZE = 4
+	"""
+	Size of the buckets of the grid used to check the distance between bonuses.
+	"""
+
+
+	__SAMPLES_PER_BONUS = 10
+	"""
+	Maximum number of samples taken for each bonus that must be placed.
+	"""
+
+
+	def __init__(self):
+		"""
+		Initializes the bonus generator.
+		"""
+		self.gc = CyGlobalContext()
+		self.map = self.gc.getMap()
+		self.mapRand = self.gc.getGame().getMapRand()
+		self.iW = self.map.getGridWidth()
+		self.iH = self.map.getGridHeight()
+
+		# Plot indexes grouped by (terrain, feature, plot type, latitude ring).
+		self.dPlotIndex = dict()
+		# Group of the index of each plot, and its position in the group (-1 if it is not in the index).
+		self.lIndexKeys = [None] * (self.iW * self.iH)
+		self.lIndexPositions = [-1] * (self.iW * self.iH)
+		# Latitude of each plot, in degrees, and rows of the latitude used for terrain types.
+		self.lLatitudes = [0] * (self.iW * self.iH)
+		self.lLatitudeRows = terrainLatitudes
+		if self.lLatitudeRows is None:
+			self.lLatitudeRows = getLatitudeRows(terrainVarFractal)
+		# Bonus of each plot.
+		self.lPlotBonuses = [-1] * (self.iW * self.iH)
+		# Number of bonuses of each type, in total and on land.
+		self.lNumBonuses = [0] * self.gc.getNumBonusInfos()
+		self.lNumBonusesOnLand = [0] * self.gc.getNumBonusInfos()
+		# Bonuses placed so far, as lists of (x, y, bonus, bonus class, area) indexed by bucket.
+		self.dBuckets = dict()
+
+
+	def addBonuses(self):
+		"""
+		Places all bonus types, following their placement order.
+		"""
+		self.buildPlotIndex()
+
+		lBonuses = list()
+		for iBonus in range(self.gc.getNumBonusInfos()):
+			iOrder = self.gc.getBonusInfo(iBonus).getPlacementOrder()
+			if iOrder >= 0:
+				lBonuses.append((iOrder, iBonus))
+		lBonuses.sort()
+
+		for iOrder, iBonus in lBonuses:
+			self.addBonusType(iBonus)
+
+
+	def buildPlotIndex(self):
+		"""
+		Groups all plots inside of the disc that do not have a bonus by terrain, feature, plot type and latitude ring.
+		Peaks are not included, as they can never have bonuses.
+		"""
+		for iY in range(self.iH):
+			self.addRowToIndex(iY, 0, self.iW - 1)
+
+
+	def addRowToIndex(self, iY, iFirstX, iLastX):
+		"""
+		Adds the plots of a part of a row that are inside of the disc to the index, and records the bonuses that they
+		already have.
+		:param iY: y coordinate of the row.
+		:param iFirstX: x coordinate of the first plot.
+		:param iLastX: x coordinate of the last plot.
+		"""
+		iDiscFirstX, iDiscLastX = getDiscRowSpan(iY, self.iW, self.iH)
+		lLatitudeRow = self.lLatitudeRows[iY]
+		for iX in range(max(iFirstX, iDiscFirstX), min(iLastX, iDiscLastX) + 1):
+			iPlot = iY * self.iW + iX
+			pPlot = self.map.plotByIndex(iPlot)
+			iLatitude = int(lLatitudeRow[iX] * 90)
+			self.lLatitudes[iPlot] = iLatitude
+
+			if pPlot.getBonusType(-1) != -1:
+				self.recordBonus(pPlot.getBonusType(-1), iPlot)
+				continue
+			if pPlot.getPlotType() == PlotTypes.PLOT_PEAK:
+				continue
+
+			tKey = (pPlot.getTerrainType(), pPlot.getFeatureType(), int(pPlot.getPlotType()), iLatitude / self.__RING_SIZE)
+			self.addToIndex(iPlot, tKey)
+
+
+	def addToIndex(self, iPlot, tKey):
+		"""
+		Adds a plot to a group of the index.
+		:param iPlot: Index of the plot.
+		:param tKey: Key of the group of the index.
+		"""
+		if not self.dPlotIndex.has_key(tKey):
+			self.dPlotIndex[tKey] = list()
+		self.lIndexKeys[iPlot] = tKey
+		self.lIndexPositions[iPlot] = len(self.dPlotIndex[tKey])
+		self.dPlotIndex[tKey].append(iPlot)
+
+
+	def removeFromIndex(self, iPlot):
+		"""
+		Removes a plot from its group of the index, by moving the last plot of the group to its position. Plots that are
+		not in the index are ignored.
+		:param iPlot: Index of the plot.
+		"""
+		iPosition = self.lIndexPositions[iPlot]
+		if iPosition < 0:
+			return
+
+		lGroup = self.dPlotIndex[self.lIndexKeys[iPlot]]
+		iLastPlot = lGroup.pop()
+		if iLastPlot != iPlot:
+			lGroup[iPosition] = iLastPlot
+			self.lIndexPositions[iLastPlot] = iPosition
+		self.lIndexPositions[iPlot] = -1
+
+
+	def isValidIndexKey(self, bonusInfo, tKey):
+		"""
+		Checks if the plots of a group of the index can have a bonus type. This is a fast filter; each plot is checked
+		again before placing the bonus.
+		:param bonusInfo: Information of the bonus type.
+		:param tKey: Key of the group of the index.
+		:return: True if the plots of the group can have the bonus, False otherwise.
+		"""
+		iTerrain, iFeature, iPlotType, iRing = tKey
+
+		if iRing * self.__RING_SIZE > bonusInfo.getMaxLatitude():
+			return False
+		if (iRing + 1) * self.__RING_SIZE <= bonusInfo.getMinLatitude():
+			return False
+
+		if iFeature != -1:
+			if not bonusInfo.isFeature(iFeature) or not bonusInfo.isFeatureTerrain(iTerrain):
+				return False
+		elif not bonusInfo.isTerrain(iTerrain):
+			return False
+
+		if iPlotType == int(PlotTypes.PLOT_HILLS):
+			return bonusInfo.isHills()
+		if iPlotType == int(PlotTypes.PLOT_LAND):
+			return bonusInfo.isFlatlands()
+
+		return True
+
+
+	def getNumBonusesToAdd(self, bonusInfo, iNumPossible):
+		"""
+		Calculates how many bonuses of a type must be placed, in the same way as Civilization IV. The number of eligible
+		plots is obtained from the index.
+		:param bonusInfo: Information of the bonus type.
+		:param iNumPossible: Number of plots that can have the bonus.
+		:return: Number of bonuses to place.
+		"""
+		iBaseCount = bonusInfo.getConstAppearance()
+		for iRandAppearance in [bonusInfo.getRandAppearance1(), bonusInfo.getRandAppearance2(),
+		                        bonusInfo.getRandAppearance3(), bonusInfo.getRandAppearance4()]:
+			if iRandAppearance > 0:
+				iBaseCount += self.mapRand.get(iRandAppearance, "[DiscWorld] - Amount of bonuses.")
+
+		iLandTiles = 0
+		if bonusInfo.getTilesPer() > 0:
+			iLandTiles += iNumPossible / bonusInfo.getTilesPer()
+		iLandTiles += (self.gc.getGame().countCivPlayersAlive() * bonusInfo.getPercentPerPlayer()) / 100
+
+		return max(1, (iBaseCount * iLandTiles) / 100)
+
+
+	def getNumIndexedPlots(self, lKeys):
+		"""
+		Counts the plots of some groups of the index.
+		:param lKeys: Keys of the groups.
+		:return: Number of plots.
+		"""
+		iNumPlots = 0
+		for tKey in lKeys:
+			iNumPlots += len(self.dPlotIndex[tKey])
+		return iNumPlots
+
+
+	def addBonusType(self, iBonus):
+		"""
+		Places all bonuses of a type, by taking random samples of the groups of the index that are compatible with it.
+		Sampled plots are removed from the index while the bonus type is placed, so each sample is taken from plots that
+		have not been checked yet. Rejected plots are added again afterwards, as they can be valid for other bonus types.
+		:param iBonus: Bonus type.
+		"""
+		bonusInfo = self.gc.getBonusInfo(iBonus)
+
+		lKeys = [tKey for tKey in self.dPlotIndex.keys() if self.isValidIndexKey(bonusInfo, tKey)]
+		iNumPossible = self.getNumIndexedPlots(lKeys)
+		if iNumPossible == 0:
+			return
+
+		iBonusCount = self.getNumBonusesToAdd(bonusInfo, iNumPossible)
+		iArea = -1
+		iPlaced = 0
+		lRejected = list()
+
+		for iSample in range(iBonusCount * self.__SAMPLES_PER_BONUS):
+			if iPlaced >= iBonusCount or iNumPossible == 0:
+				break
+
+			# Locate the sampled plot in its group of the index.
+			iPosition = self.mapRand.get(iNumPossible, "[DiscWorld] - Bonus placement.")
+			for tKey in lKeys:
+				lGroup = self.dPlotIndex[tKey]
+				if iPosition < len(lGroup):
+					break
+				iPosition -= len(lGroup)
+
+			iPlot = lGroup[iPosition]
+			self.removeFromIndex(iPlot)
+			iNumPossible -= 1
+
+			pPlot = self.map.plotByIndex(iPlot)
+			if iArea != -1 and pPlot.getArea() != iArea:
+				bValid = False
+			else:
+				bValid = self.canPlaceBonusAt(bonusInfo, iBonus, iPlot, True)
+			if not bValid:
+				lRejected.append(iPlot)
+				continue
+
+			self.placeBonus(iBonus, iPlot)
+			iPlaced += 1
+
+			if bonusInfo.isOneArea():
+				iArea = pPlot.getArea()
+			iGroupPlaced = self.addBonusGroup(bonusInfo, iBonus, iPlot, iBonusCount - iPlaced)
+			if iGroupPlaced > 0:
+				# The plots of the group are removed from the index as well.
+				iPlaced += iGroupPlaced
+				iNumPossible = self.getNumIndexedPlots(lKeys)
+
+		# Plots can also receive a bonus in a group after being rejected.
+		for iPlot in lRejected:
+			if self.lPlotBonuses[iPlot] == -1:
+				self.addToIndex(iPlot, self.lIndexKeys[iPlot])
+
+
+	def addBonusGroup(self, bonusInfo, iBonus, iPlot, iMaxBonuses):
+		"""
+		Randomly places more bonuses of the same type around a bonus, if the bonus type uses groups. Bonuses that must
+		be placed in a single area are only placed in the area of the original bonus.
+		:param bonusInfo: Information of the bonus type.
+		:param iBonus: Bonus type.
+		:param iPlot: Index of the plot of the original bonus.
+		:param iMaxBonuses: Maximum number of bonuses to place.
+		:return: Number of bonuses placed.
+		"""
+		iRange = bonusInfo.getGroupRange()
+		iPlaced = 0
+		if iRange <= 0:
+			return iPlaced
+
+		iArea = -1
+		if bonusInfo.isOneArea():
+			iArea = self.map.plotByIndex(iPlot).getArea()
+
+		iX = iPlot % self.iW
+		iY = iPlot / self.iW
+		for iLoopX in range(max(0, iX - iRange), min(self.iW, iX + iRange + 1)):
+			for iLoopY in range(max(0, iY - iRange), min(self.iH, iY + iRange + 1)):
+				if iPlaced >= iMaxBonuses:
+					return iPlaced
+				if self.mapRand.get(100, "[DiscWorld] - Bonus group.") >= bonusInfo.getGroupRand():
+					continue
+				iLoopPlot = iLoopY * self.iW + iLoopX
+				if isOutsideDisc(iLoopX, iLoopY):
+					continue
+				if iArea != -1 and self.map.plotByIndex(iLoopPlot).getArea() != iArea:
+					continue
+				if self.canPlaceBonusAt(bonusInfo, iBonus, iLoopPlot, False):
+					self.placeBonus(iBonus, iLoopPlot)
+					iPlaced += 1
+
+		return iPlaced
+
+
+	def canPlaceBonusAt(self, bonusInfo, iBonus, iPlot, bCheckUniqueRange):
+		"""
+		Checks if a bonus can be placed in a plot, including its latitude and its distance to other bonuses. Bonuses of
+		the same class or type are only kept apart inside of the same area, and bonuses in water plots must keep the
+		minimum percent of the bonus type on land.
+		:param bonusInfo: Information of the bonus type.
+		:param iBonus: Bonus type.
+		:param iPlot: Index of the plot.
+		:param bCheckUniqueRange: Check the distance to other bonuses of the same type.
+		:return: True if the bonus can be placed, False otherwise.
+		"""
+		if self.lPlotBonuses[iPlot] != -1:
+			return False
+		iLatitude = self.lLatitudes[iPlot]
+		if iLatitude < bonusInfo.getMinLatitude() or iLatitude > bonusInfo.getMaxLatitude():
+			return False
+		pPlot = self.map.plotByIndex(iPlot)
+		if not pPlot.canHaveBonus(iBonus, True):
+			return False
+		if pPlot.isWater():
+			if (self.lNumBonusesOnLand[iBonus] * 100) / (self.lNumBonuses[iBonus] + 1) < bonusInfo.getMinLandPercent():
+				return False
+
+		iClass = bonusInfo.getBonusClassType()
+		iClassRange = self.gc.getBonusClassInfo(iClass).getUniqueRange()
+		iUniqueRange = 0
+		if bCheckUniqueRange:
+			iUniqueRange = bonusInfo.getUniqueRange()
+		iRange = max(1, iClassRange, iUniqueRange)
+
+		iX = iPlot % self.iW
+		iY = iPlot / self.iW
+		iArea = pPlot.getArea()
+		for iBucketX in range((iX - iRange) / self.__BUCKET_SIZE, (iX + iRange) / self.__BUCKET_SIZE + 1):
+			for iBucketY in range((iY - iRange) / self.__BUCKET_SIZE, (iY + iRange) / self.__BUCKET_SIZE + 1):
+				for iOtherX, iOtherY, iOtherBonus, iOtherClass, iOtherArea in self.dBuckets.get((iBucketX, iBucketY), []):
+					iDistance = max(abs(iOtherX - iX), abs(iOtherY - iY))
+					if iOtherBonus != iBonus:
+						# Different bonuses cannot be adjacent, nor near bonuses of the same class in the same area.
+						if iDistance <= 1:
+							return False
+						if iOtherClass == iClass and iOtherArea == iArea and iDistance <= iClassRange:
+							return False
+					elif iOtherArea == iArea and iDistance <= iUniqueRange:
+						return False
+
+		return True
+
+
+	def placeBonus(self, iBonus, iPlot):
+		"""
+		Places a bonus in a plot.
+		:param iBonus: Bonus type.
+		:param iPlot: Index of the plot.
+		"""
+		self.map.plotByIndex(iPlot).setBonusType(iBonus)
+		self.recordBonus(iBonus, iPlot)
+
+
+	def recordBonus(self, iBonus, iPlot):
+		"""
+		Records a bonus of the map in the generator, and removes its plot from the index.
+		:param iBonus: Bonus type.
+		:param iPlot: Index of the plot.
+		"""
+		pPlot = self.map.plotByIndex(iPlot)
+		self.lPlotBonuses[iPlot] = iBonus
+		self.lNumBonuses[iBonus] += 1
+		if not pPlot.isWater():
+			self.lNumBonusesOnLand[iBonus] += 1
+		self.removeFromIndex(iPlot)
+		self.addToBuckets(iPlot % self.iW, iPlot / self.iW, iBonus, pPlot.getArea())
+
+
+	def addToBuckets(self, iX, iY, iBonus, iArea):
+		"""
+		Adds a bonus to the grid of buckets used to check the distance between bonuses.
+		:param iX: x coordinate of the plot.
+		:param iY: y coordinate of the plot.
+		:param iBonus: Bonus type.
+		:param iArea: Area of the plot.
+		"""
+		tBucket = (iX / self.__BUCKET_SIZE, iY / self.__BUCKET_SIZE)
+		if not self.dBuckets.has_key(tBucket):
+			self.dBuckets[tBucket] = list()
+		self.dBuckets[tBucket].append((iX, iY, iBonus, self.gc.getBonusInfo(iBonus).getBonusClassType(), iArea))
+
+
+class DiscworldBonusScalingGenerator(DiscworldBonusGenerator):
+	"""
+	Bonus generator used by checkComplexityScaling. It only indexes a band of rows in the middle of the map, which
+	crosses all the latitude rings of the disc, and places a fixed number of bonuses of each type, so that the cost of
+	placing them can be measured against the size of the band. Bonuses are only recorded by the generator, and random
+	numbers are taken from a separate random number generator, so the map is not changed.
+	"""
+
+	def __init__(self, iBandHeight, iBonusesPerType, dice):
+		"""
+		Initializes the bonus generator.
+		:param iBandHeight: Number of rows of the band.
+		:param iBonusesPerType: Number of bonuses of each type to place.
+		:param dice: Random number generator used instead of the map one.
+		"""
+		DiscworldBonusGenerator.__init__(self)
+		self.mapRand = dice
+		self.iBandHeight = min(iBandHeight, self.iH)
+		self.iBonusesPerType = iBonusesPerType
+
+
+	def buildPlotIndex(self):
+		"""
+		Groups the plots of the band like DiscworldBonusGenerator.buildPlotIndex.
+		"""
+		iFirstY = (self.iH - self.iBandHeight) / 2
+		for iY in range(iFirstY, iFirstY + self.iBandHeight):
+			self.addRowToIndex(iY, 0, self.iW - 1)
+
+
+	def getNumBonusesToAdd(self, bonusInfo, iNumPossible):
+		"""
+		Returns the fixed number of bonuses of each type.
+		:param bonusInfo: Information of the bonus type.
+		:param iNumPossible: Number of plots that can have the bonus.
+		:return: Number of bonuses to place.
+		"""
+		return self.iBonusesPerType
+
+
+	def placeBonus(self, iBonus, iPlot):
+		"""
+		Records a bonus in the generator, without placing it in the map.
+		:param iBonus: Bonus type.
+		:param iPlot: Index of the plot.
+		"""
+		self.recordBonus(iBonus, iPlot)
+
+
 class MapAreaPolygon:
 	"""
 	Class that defines a map area that can have any polygonal shape. Randomized distortion using both fractals and
@@ -614,21 +1342,46 @@ class MapAreaPolygon:
 	"""
 
 
-	def __init__(self, sRegionName, lOriginalPolygonPoints, fAngle):
+	def __init__(self, sRegionName, lOriginalPolygonPoints, fAngle, iGridWidth = -1, iGridHeight = -1, fScale = 1.0,
+	             fracDice = None, layoutDice = None, bSharedDisplacement = False):
 		"""
 		Initializes the polygonal map area.
+		:param sRegionName: Name of the region, used in the log.
 		:param lOriginalPolygonPoints: List of tuples that contain the x and y coordinates of each of the points.
 		:param fAngle: The polygon will be rotated by this angle.
+		:param iGridWidth: Width of the grid in which the polygon is placed. By default, the width of the map.
+		:param iGridHeight: Height of the grid in which the polygon is placed. By default, the height of the map.
+		:param fScale: Scale of the grid with regard to the map. Random displacements are chosen for the size of the map
+		and multiplied by this value, so the shape of the polygon does not depend on the scale.
+		:param fracDice: Random number generator used for the displacement fractals. By default, the map one.
+		:param layoutDice: Random number generator used for displacing the vertices. By default, the map one.
+		:param bSharedDisplacement: If True, the displacement fractals shared by all polygons of the map are used,
+		sampled at map coordinates. Otherwise, the polygon creates its own displacement fractals.
 		"""
 		if len(lOriginalPolygonPoints) < 3:
 			raise Exception("[DiscWorld] - " + sRegionName + " - A polygon must have at least three vertices.")
 
+		self.__sRegionName = sRegionName
+
+		if iGridWidth < 0:
+			iGridWidth = map.getGridWidth()
+			iGridHeight = map.getGridHeight()
+		if fracDice is None:
+			fracDice = game.getMapRand()
+		if layoutDice is None:
+			layoutDice = game.getMapRand()
+		self.__fScale = fScale
+		self.__layoutDice = layoutDice
+		self.__iGridWidth = iGridWidth
+		self.__iGridHeight = iGridHeight
+		self.__bSharedDisplacement = bSharedDisplacement
+
 		# Rotate the polygon and apply random displacement.
 		lPolygonPoints = list()
 
 		self.__iRandomDisplacement = int(max(2.0, map.getGridWidth() / 12.0))
-		fMiddleX = map.getGridWidth() / 2.0
-		fMiddleY = map.getGridHeight() / 2.0
+		fMiddleX = iGridWidth / 2.0
+		fMiddleY = iGridHeight / 2.0
 		fSinAngle = math.sin(fAngle)
 		fCosAngle = math.cos(fAngle)
 
@@ -639,6 +1392,8 @@ class MapAreaPolygon:
 			pYRotated = pXInitial * fSinAngle + pYInitial * fCosAngle + fMiddleY + self.__getRandomDisplacement()
 			lPolygonPoints.append([pXRotated, pYRotated])
 
+		self.__lPolygonPoints = lPolygonPoints
+
 		# Calculate the rest of the values that depend on the shape of the polygon.
 		self.__fMinX = sys.maxint
 		self.__fMinY = sys.maxint
@@ -652,75 +1407,102 @@ class MapAreaPolygon:
 			self.__fMaxY = max(self.__fMaxY, pY)
 
 		# Give room for fractal displacement.
-		self.__fMinX -= 4.0
-		self.__fMinY -= 4.0
-		self.__fMaxX += 4.0
-		self.__fMaxY += 4.0
+		self.__fMinX -= 4.0 * fScale
+		self.__fMinY -= 4.0 * fScale
+		self.__fMaxX += 4.0 * fScale
+		self.__fMaxY += 4.0 * fScale
 
 		# Used for creating displacement fractals and initial isInside checks.
 		self.__iRegionWidth = int(self.__fMaxX - self.__fMinX + 1)
 		self.__iRegionHeight = int(self.__fMaxY - self.__fMinY + 1)
 
 		# Perfect polygons are boring. These fractals are used to distort the shape of the resulting landmass slightly.
-		self.__horizontalDisplacementFrac = CyFractal()
-		self.__horizontalDisplacementFrac.fracInit(
-			self.__iRegionWidth, self.__iRegionHeight, self.__DISPLACEMENT_FRACTAL_GRAIN, game.getMapRand(),
-			CyFractal.FracVals.FRAC_POLAR, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP
-		)
+		if bSharedDisplacement:
+			global sharedDisplacementFractals
+			if sharedDisplacementFractals is None or sharedDisplacementFractals[:2] != (iGridWidth, iGridHeight):
+				sharedDisplacementFractals = (
+					iGridWidth, iGridHeight,
+					self.__getDisplacementFractal(iGridWidth, iGridHeight, fracDice),
+					self.__getDisplacementFractal(iGridWidth, iGridHeight, fracDice)
+				)
+			self.__horizontalDisplacementFrac = sharedDisplacementFractals[2]
+			self.__verticalDisplacementFrac = sharedDisplacementFractals[3]
+		else:
+			self.__horizontalDisplacementFrac = self.__getDisplacementFractal(
+				self.__iRegionWidth, self.__iRegionHeight, fracDice)
+			self.__verticalDisplacementFrac = self.__getDisplacementFractal(
+				self.__iRegionWidth, self.__iRegionHeight, fracDice)
+
+		# Since all points need to be accessed at least once, they can be calculated on init. Each row of the matrix is
+		# stored as a bit mask, in which bit x is set if column x of the bounding box is inside of the polygon.
+		self.__lInsideRows = [0] * self.__iRegionHeight
+		for iY in range(self.__iRegionHeight):
+			iMask = 0
+			for iX in range(self.__iRegionWidth):
+				if self.__isInsidePolygon(iX, iY):
+					iMask |= 1L << iX
+			self.__lInsideRows[iY] = iMask
+
 
-		self.__verticalDisplacementFrac = CyFractal()
-		self.__verticalDisplacementFrac.fracInit(
-			self.__iRegionWidth, self.__iRegionHeight, self.__DISPLACEMENT_FRACTAL_GRAIN, game.getMapRand(),
+	def __getDisplacementFractal(self, iWidth, iHeight, fracDice):
+		"""
+		Initializes a fractal used to displace the points of the polygon.
+		:param iWidth: Width of the fractal.
+		:param iHeight: Height of the fractal.
+		:param fracDice: Random number generator.
+		:return: New fractal.
+		"""
+		displacementFrac = CyFractal()
+		displacementFrac.fracInit(
+			iWidth, iHeight, self.__DISPLACEMENT_FRACTAL_GRAIN, fracDice,
 			CyFractal.FracVals.FRAC_POLAR, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP
 		)
+		return displacementFrac
 
-		# Since all points need to be accessed at least once, they can be calculated on init.
-		self.__bInsideMatrix = [[False for iY in range(self.__iRegionHeight)] for iX in range(self.__iRegionWidth)]
-
-		# PNPOLY algorithm for determining if a given plot is inside of the polygon or not.
-		for iX in range(self.__iRegionWidth):
-			for iY in range(self.__iRegionHeight):
-				# Apply displacement values between -4.0 and 4.0.
-				fHorizontalDisp = self.__horizontalDisplacementFrac.getHeight(iX, iY) / 32.0 - 4.0
-				fVerticalDisp = self.__verticalDisplacementFrac.getHeight(iX, iY) / 32.0 - 4.0
-
-				fRealX = self.__fMinX + iX + fHorizontalDisp
-				fRealY = self.__fMinY + iY + fVerticalDisp
-
-				iPoint = 0
-				jPoint = len(lPolygonPoints) - 1
-				bInside = False
-
-				while iPoint < len(lPolygonPoints):
-					lFirstPoint = lPolygonPoints[iPoint]
-					lSecondPoint = lPolygonPoints[jPoint]
-					if (lFirstPoint[1] > fRealY) != (lSecondPoint[1] > fRealY):
-						fValue = float(lSecondPoint[0] - lFirstPoint[0])
-						fValue *= fRealY - lFirstPoint[1]
-						fValue /= lSecondPoint[1] - lFirstPoint[1]
-						fValue += lFirstPoint[0]
-						if fRealX < fValue:
-							bInside = not bInside
-
-					# Prepare the next pair of points.
-					jPoint = iPoint
-					iPoint += 1
-
-				if bInside:
-					self.__bInsideMatrix[iX][iY] = True
-
-		# Uncommenting this code displays all regions in the log.
-		"""
-		print "[DiscWorld] - " + sRegionName + " - MapAreaPolygon map area:"
-		for iY in range(self.__iRegionHeight - 1, -1, -1):
-			sLine = ""
-			for iX in range(self.__iRegionWidth):
-				if self.__bInsideMatrix[iX][iY]:
-					sLine += "#"
-				else:
-					sLine += " "
-			print sLine
+
+	def __isInsidePolygon(self, iX, iY):
+		"""
+		PNPOLY algorithm for determining if a given plot is inside of the polygon or not, after applying displacement.
+		:param iX: x coordinate of the plot, relative to the bounding box of the polygon.
+		:param iY: y coordinate of the plot, relative to the bounding box of the polygon.
+		:return: True if the plot is inside of the polygon, False otherwise.
 		"""
+		lPolygonPoints = self.__lPolygonPoints
+
+		# Shared displacement fractals are sampled at map coordinates, clamped to the grid.
+		iFracX = iX
+		iFracY = iY
+		if self.__bSharedDisplacement:
+			iFracX = min(max(int(self.__fMinX + iX), 0), self.__iGridWidth - 1)
+			iFracY = min(max(int(self.__fMinY + iY), 0), self.__iGridHeight - 1)
+
+		# Apply displacement values between -4.0 and 4.0, scaled to the size of the grid.
+		fHorizontalDisp = (self.__horizontalDisplacementFrac.getHeight(iFracX, iFracY) / 32.0 - 4.0) * self.__fScale
+		fVerticalDisp = (self.__verticalDisplacementFrac.getHeight(iFracX, iFracY) / 32.0 - 4.0) * self.__fScale
+
+		fRealX = self.__fMinX + iX + fHorizontalDisp
+		fRealY = self.__fMinY + iY + fVerticalDisp
+
+		iPoint = 0
+		jPoint = len(lPolygonPoints) - 1
+		bInside = False
+
+		while iPoint < len(lPolygonPoints):
+			lFirstPoint = lPolygonPoints[iPoint]
+			lSecondPoint = lPolygonPoints[jPoint]
+			if (lFirstPoint[1] > fRealY) != (lSecondPoint[1] > fRealY):
+				fValue = float(lSecondPoint[0] - lFirstPoint[0])
+				fValue *= fRealY - lFirstPoint[1]
+				fValue /= lSecondPoint[1] - lFirstPoint[1]
+				fValue += lFirstPoint[0]
+				if fRealX < fValue:
+					bInside = not bInside
+
+			# Prepare the next pair of points.
+			jPoint = iPoint
+			iPoint += 1
+
+		return bInside
 
 
 	def __getRandomDisplacement(self):
@@ -728,9 +1510,14 @@ class MapAreaPolygon:
 		Allows to apply a random displacement to one of the coordinates of one of the points of the polygon.
 		:return: Calculated displacement.
 		"""
-		return self.__iRandomDisplacement / 2 - game.getMapRand().get(
+		return (self.__iRandomDisplacement / 2 - self.__layoutDice.get(
 			self.__iRandomDisplacement,
-			"[DiscWorld] - Randomization of the points of one of the areas.")
+			"[DiscWorld] - Randomization of the points of one of the areas.")) * self.__fScale
+
+
+	@property
+	def sRegionName(self):
+		return self.__sRegionName
 
 
 	@property
@@ -768,19 +1555,194 @@ class MapAreaPolygon:
 		if iRealY < 0 or iRealY >= self.__iRegionHeight:
 			return False
 
-		return self.__bInsideMatrix[iRealX][iRealY]
+		return (self.__lInsideRows[iRealY] >> iRealX) & 1 == 1
+
+
+	def getInsideRow(self, iRegionY):
+		"""
+		Obtains a full row of the inside matrix of the polygon.
+		:param iRegionY: y coordinate of the row, relative to the bounding box of the polygon.
+		:return: List of booleans, one for each column of the bounding box. True means inside of the polygon.
+		"""
+		iMask = self.__lInsideRows[iRegionY]
+		return [(iMask >> iX) & 1 == 1 for iX in range(self.__iRegionWidth)]
+
+
+class DiscworldDistanceFields:
+	"""
+	Distances from each plot of the map to the closest coast, to the Rim of the disc and to the central hub. Each field
+	is calculated the first time that it is needed, using a two pass chamfer distance transform over the whole grid.
+	This takes linear time, instead of searching for the closest plot from each one of them.
+	"""
+
+	__ORTHOGONAL_DISTANCE = 1.0
+	"""
+	Distance between two orthogonally adjacent plots.
+	"""
+
+
+	__DIAGONAL_DISTANCE = math.sqrt(2.0)
+	"""
+	Distance between two diagonally adjacent plots.
+	"""
+
+
+	def __init__(self, plotTypes, iWidth, iHeight):
+		"""
+		Initializes the distance fields.
+		:param plotTypes: List of plot types of the map, after removing the land outside of the disc.
+		:param iWidth: Width of the map.
+		:param iHeight: Height of the map.
+		"""
+		self.__plotTypes = plotTypes
+		self.__iWidth = iWidth
+		self.__iHeight = iHeight
+		self.__lCoastDistances = None
+		self.__lRimDistances = None
+		self.__lHubDistances = None
+
+
+	def getDistanceToCoast(self, iX, iY):
+		"""
+		Distance from a land plot to the closest water plot. Water plots have a distance of 0.0.
+		:param iX: x coordinate of the plot.
+		:param iY: y coordinate of the plot.
+		:return: Calculated distance.
+		"""
+		if self.__lCoastDistances is None:
+			lSources = [ePlotType == PlotTypes.PLOT_OCEAN for ePlotType in self.__plotTypes]
+			self.__lCoastDistances = self.__getDistanceTransform(lSources, False)
+
+		return self.__lCoastDistances[iY * self.__iWidth + iX]
+
+
+	def getDistanceToRim(self, iX, iY):
+		"""
+		Distance from a plot to the closest plot outside of the disc. Plots outside of the disc have a distance of 0.0.
+		:param iX: x coordinate of the plot.
+		:param iY: y coordinate of the plot.
+		:return: Calculated distance.
+		"""
+		if self.__lRimDistances is None:
+			lSources = list()
+			for iLoopY in range(self.__iHeight):
+				for iLoopX in range(self.__iWidth):
+					lSources.append(isOutsideDisc(iLoopX, iLoopY, self.__iWidth, self.__iHeight))
+			# The edges of the grid are also next to the outside of the disc.
+			self.__lRimDistances = self.__getDistanceTransform(lSources, True)
+
+		return self.__lRimDistances[iY * self.__iWidth + iX]
+
+
+	def getDistanceToHub(self, iX, iY):
+		"""
+		Distance from a plot to the closest land plot of the core of the central hub, which is the area inside of the
+		snow radius. If this area has no land, the distance to the center of the disc is used instead.
+		:param iX: x coordinate of the plot.
+		:param iY: y coordinate of the plot.
+		:return: Calculated distance.
+		"""
+		if self.__lHubDistances is None:
+			lSources = [False] * (self.__iWidth * self.__iHeight)
+			for iLoopY in range(self.__iHeight):
+				for iLoopX in range(self.__iWidth):
+					iPlot = iLoopY * self.__iWidth + iLoopX
+					if self.__plotTypes[iPlot] == PlotTypes.PLOT_OCEAN:
+						continue
+					fDistance = getDistanceToCenterUnscaled(iLoopX, iLoopY, None, self.__iWidth, self.__iHeight)
+					lSources[iPlot] = fDistance <= fSnowRadius
+			if True not in lSources:
+				lSources[(self.__iHeight / 2) * self.__iWidth + self.__iWidth / 2] = True
+			self.__lHubDistances = self.__getDistanceTransform(lSources, False)
+
+		return self.__lHubDistances[iY * self.__iWidth + iX]
+
+
+	def __getDistanceTransform(self, lSources, bEdgeIsSource):
+		"""
+		Two pass chamfer distance transform. The first pass propagates distances from the previous row and column, and
+		the second one from the next row and column.
+		:param lSources: List of booleans, True for the plots from which distances are measured.
+		:param bEdgeIsSource: If True, the area beyond the edges of the grid is also considered a source.
+		:return: List with the distance from each plot to its closest source.
+		"""
+		iWidth = self.__iWidth
+		iHeight = self.__iHeight
+		fOrthogonal = self.__ORTHOGONAL_DISTANCE
+		fDiagonal = self.__DIAGONAL_DISTANCE
+		fInfinity = float(iWidth + iHeight) * fDiagonal
+
+		lDistances = [fInfinity] * (iWidth * iHeight)
+		for iPlot in range(iWidth * iHeight):
+			if lSources[iPlot]:
+				lDistances[iPlot] = 0.0
+			elif bEdgeIsSource:
+				iX = iPlot % iWidth
+				iY = iPlot / iWidth
+				if iX == 0 or iY == 0 or iX == iWidth - 1 or iY == iHeight - 1:
+					lDistances[iPlot] = fOrthogonal
+
+		# First pass: west, southwest, south and southeast neighbors.
+		for iY in range(iHeight):
+			iRowStart = iY * iWidth
+			for iX in range(iWidth):
+				iPlot = iRowStart + iX
+				fDistance = lDistances[iPlot]
+				if fDistance == 0.0:
+					continue
+				if iX > 0:
+					fDistance = min(fDistance, lDistances[iPlot - 1] + fOrthogonal)
+				if iY > 0:
+					iPrevious = iPlot - iWidth
+					fDistance = min(fDistance, lDistances[iPrevious] + fOrthogonal)
+					if iX > 0:
+						fDistance = min(fDistance, lDistances[iPrevious - 1] + fDiagonal)
+					if iX < iWidth - 1:
+						fDistance = min(fDistance, lDistances[iPrevious + 1] + fDiagonal)
+				lDistances[iPlot] = fDistance
+
+		# Second pass: east, northeast, north and northwest neighbors.
+		for iY in range(iHeight - 1, -1, -1):
+			iRowStart = iY * iWidth
+			for iX in range(iWidth - 1, -1, -1):
+				iPlot = iRowStart + iX
+				fDistance = lDistances[iPlot]
+				if fDistance == 0.0:
+					continue
+				if iX < iWidth - 1:
+					fDistance = min(fDistance, lDistances[iPlot + 1] + fOrthogonal)
+				if iY < iHeight - 1:
+					iNext = iPlot + iWidth
+					fDistance = min(fDistance, lDistances[iNext] + fOrthogonal)
+					if iX < iWidth - 1:
+						fDistance = min(fDistance, lDistances[iNext + 1] + fDiagonal)
+					if iX > 0:
+						fDistance = min(fDistance, lDistances[iNext - 1] + fDiagonal)
+				lDistances[iPlot] = fDistance
+
+		return lDistances
 
 
-def getVariationFractal(iGrain):
+def getVariationFractal(iGrain, iGridWidth=-1, iGridHeight=-1, dice=None):
 	"""
 	Initializes a fractal that can be used to introduce random variations.
+	:param iGrain: Grain of the fractal.
+	:param iGridWidth: Width of the grid. By default, the width of the map.
+	:param iGridHeight: Height of the grid. By default, the height of the map.
+	:param dice: Random number generator of the fractal. By default, the map one.
 	:return: New fractal.
 	"""
+	if iGridWidth < 0:
+		iGridWidth = map.getGridWidth()
+		iGridHeight = map.getGridHeight()
+	if dice is None:
+		dice = game.getMapRand()
+
 	varFractal = CyFractal()
 	iFlags = 0  # Disallow FRAC_POLAR flag, to prevent "zero row" problems.
 
 	varFractal.fracInit(
-		map.getGridWidth(), map.getGridHeight(), iGrain, game.getMapRand(), iFlags,
+		iGridWidth, iGridHeight, iGrain, dice, iFlags,
 		# The Discworld has the same width and height.
 		CyFractal.FracVals.DEFAULT_FRAC_Y_EXP, CyFractal.FracVals.DEFAULT_FRAC_Y_EXP
 	)
@@ -788,16 +1750,22 @@ def getVariationFractal(iGrain):
 	return varFractal
 
 
-def getDistanceToCenterUnscaled(iX, iY, varFractal=None):
+def getDistanceToCenterUnscaled(iX, iY, varFractal=None, iGridWidth=-1, iGridHeight=-1):
 	"""
 	Calculates an approximate distance from the point to the center of the disc.
 	:param iX: x coordinate of the plot
 	:param iY: y coordinate of the plot.
 	:param varFractal: Fractal used to introduce random variations in the calculated distance.
+	:param iGridWidth: Width of the grid. By default, the width of the map.
+	:param iGridHeight: Height of the grid. By default, the height of the map.
 	:return: Calculated distance.
 	"""
-	fHorizontal = ((map.getGridWidth() - 1) / 2.0 - iX) / ((map.getGridWidth() - 1) / 2.0)
-	fVertical = ((map.getGridHeight() - 1) / 2.0 - iY) / ((map.getGridHeight() - 1) / 2.0)
+	if iGridWidth < 0:
+		iGridWidth = map.getGridWidth()
+		iGridHeight = map.getGridHeight()
+
+	fHorizontal = ((iGridWidth - 1) / 2.0 - iX) / ((iGridWidth - 1) / 2.0)
+	fVertical = ((iGridHeight - 1) / 2.0 - iY) / ((iGridHeight - 1) / 2.0)
 
 	fDistance = math.sqrt(fHorizontal * fHorizontal + fVertical * fVertical)
 
@@ -828,11 +1796,857 @@ def getInvertedDistanceToCenter(iX, iY, varFractal):
 	return 1.0 - fDistance
 
 
-def isOutsideDisc(iX, iY):
+def getLatitudeRows(varFractal, iGridWidth=-1, iGridHeight=-1):
+	"""
+	Calculates the latitude of all plots of the map, as getInvertedDistanceToCenter, so that the terrain and feature
+	generators and the previews can read it instead of calculating it for each plot again. The horizontal distances are
+	shared by all rows.
+	:param varFractal: Fractal used to introduce random variations in the latitude.
+	:param iGridWidth: Width of the grid. By default, the width of the map.
+	:param iGridHeight: Height of the grid. By default, the height of the map.
+	:return: List with a list of latitudes for each row, from south to north.
+	"""
+	if iGridWidth < 0:
+		iGridWidth = map.getGridWidth()
+		iGridHeight = map.getGridHeight()
+
+	fHalfWidth = (iGridWidth - 1) / 2.0
+	fHalfHeight = (iGridHeight - 1) / 2.0
+	lHorizontalSquares = list()
+	for iX in range(iGridWidth):
+		fHorizontal = (fHalfWidth - iX) / fHalfWidth
+		lHorizontalSquares.append(fHorizontal * fHorizontal)
+
+	lRows = list()
+	for iY in range(iGridHeight):
+		fVertical = (fHalfHeight - iY) / fHalfHeight
+		fVerticalSquare = fVertical * fVertical
+		lDistances = [math.sqrt(fHorizontalSquare + fVerticalSquare) for fHorizontalSquare in lHorizontalSquares]
+		if varFractal is not None:
+			for iX in range(iGridWidth):
+				lDistances[iX] += (128 - varFractal.getHeight(iX, iY)) / (255.0 * 5.0)
+		lRows.append([1.0 - min(max(fDistance, 0.0), 1.0) for fDistance in lDistances])
+
+	return lRows
+
+
+def isOutsideDisc(iX, iY, iGridWidth=-1, iGridHeight=-1):
 	"""
 	Checks if a specific plot is outside of the disc.
 	:param iX: x coordinate of the plot
 	:param iY: y coordinate of the plot.
+	:param iGridWidth: Width of the grid. By default, the width of the map.
+	:param iGridHeight: Height of the grid. By default, the height of the map.
 	:return: True if the plot is outside of the disc, False otherwise.
 	"""
-	return getDistanceToCenterUnscaled(iX, iY) > 1.0
\ No newline at end of file
+	return getDistanceToCenterUnscaled(iX, iY, None, iGridWidth, iGridHeight) > 1.0
+
+
+def getDiscRowSpan(iY, iGridWidth, iGridHeight):
+	"""
+	Finds the plots of a row that are inside of the disc. They are always a single span of plots, so only the plots
+	near its ends are checked with isOutsideDisc.
+	:param iY: y coordinate of the row.
+	:param iGridWidth: Width of the grid.
+	:param iGridHeight: Height of the grid.
+	:return: Tuple with the x coordinates of the first and the last plot of the row inside of the disc. The first one is
+	greater than the last one if the row is completely outside of the disc.
+	"""
+	fMiddleX = (iGridWidth - 1) / 2.0
+	fVertical = ((iGridHeight - 1) / 2.0 - iY) / ((iGridHeight - 1) / 2.0)
+	fHalfSpan = fMiddleX * math.sqrt(max(0.0, 1.0 - fVertical * fVertical))
+	iFirstX = max(0, int(math.ceil(fMiddleX - fHalfSpan)))
+	iLastX = min(iGridWidth - 1, int(math.floor(fMiddleX + fHalfSpan)))
+
+	# Correct the rounding errors of the estimation.
+	while iFirstX <= iLastX and isOutsideDisc(iFirstX, iY, iGridWidth, iGridHeight):
+		iFirstX += 1
+	while iFirstX > 0 and not isOutsideDisc(iFirstX - 1, iY, iGridWidth, iGridHeight):
+		iFirstX -= 1
+	while iLastX >= iFirstX and isOutsideDisc(iLastX, iY, iGridWidth, iGridHeight):
+		iLastX -= 1
+	while iLastX < iGridWidth - 1 and not isOutsideDisc(iLastX + 1, iY, iGridWidth, iGridHeight):
+		iLastX += 1
+
+	return iFirstX, iLastX
+
+
+def removeLandOutsideDisc(plotTypes, iWidth, iHeight):
+	"""
+	Turns all plots outside of the disc into water.
+	:param plotTypes: List of plot types, modified in place.
+	:param iWidth: Width of the grid.
+	:param iHeight: Height of the grid.
+	"""
+	for iX in range(iWidth):
+		for iY in range(iHeight):
+			if isOutsideDisc(iX, iY, iWidth, iHeight):
+				plotTypes[iY * iWidth + iX] = PlotTypes.PLOT_OCEAN
+
+
+def isInsidePlayableRegion(pID, iX, iY):
+	"""
+	Checks if a player can start in a plot. Used by findStartingPlot.
+	:param pID: ID of the player.
+	:param iX: x coordinate of the plot.
+	:param iY: y coordinate of the plot.
+	:return: True if the plot is inside of a starting region and not closer to the Rim than iMinStartingRimDistance,
+	False otherwise.
+	"""
+	if iMinStartingRimDistance > 0 and distanceFields is not None:
+		if distanceFields.getDistanceToRim(iX, iY) < iMinStartingRimDistance:
+			return False
+
+	for mapAreaPolygon in lStartingPlotAreas:
+		if mapAreaPolygon.isInside(iX, iY):
+			return True
+
+	return False
+
+
+def isMapPreviewEnabled():
+	"""
+	Checks if any of the map preview outputs is enabled. See bPrintMapPreview and sMapPreviewDirectory.
+	:return: True if map previews must be generated, False otherwise.
+	"""
+	return bPrintMapPreview or sMapPreviewDirectory is not None
+
+
+def showMapPreview(sName, iWidth, iHeight, getRow, sSymbols, lPalette=None, sComment=None, lLegend=None):
+	"""
+	Prints a map preview to the log and/or saves it as a PNG image. The preview is built from whole rows, from north to
+	south. Each row is converted to a byte string that is used directly for both outputs and then discarded, so only
+	one row is kept in memory.
+	The PNG image can also have a legend drawn below the preview. The image is widened if the legend does not fit.
+	:param sName: Name of the preview. It is also used to name the PNG image.
+	:param iWidth: Width of the preview.
+	:param iHeight: Height of the preview.
+	:param getRow: Function that receives the y coordinate of a row and returns a list with its values, between 0 and
+	255.
+	:param sSymbols: Characters used in the ASCII preview. When a palette is used, each value uses the character in its
+	position. Otherwise, values are distributed evenly among all characters.
+	:param lPalette: List of (red, green, blue) tuples with the color used for each value. If it is None, values are
+	treated as grey levels.
+	:param sComment: Additional information about the preview, or None.
+	:param lLegend: List of lines of text drawn below the PNG image, or None.
+	"""
+	if lPalette is None:
+		sTable = "".join([sSymbols[iValue * len(sSymbols) / 256] for iValue in range(256)])
+	else:
+		sTable = sSymbols + "?" * (256 - len(sSymbols))
+
+	if bPrintMapPreview:
+		print "[DISCWORLD] -- Map preview: " + sName
+		if sComment is not None:
+			print "[DISCWORLD] -- " + sComment
+
+	if sMapPreviewDirectory is None:
+		for iY in range(iHeight - 1, -1, -1):
+			print array.array('B', getRow(iY)).tostring().translate(sTable)
+		return
+
+	# The legend uses black text over white, added at the end of the palette if there is one.
+	iImageWidth = iWidth
+	iImageHeight = iHeight
+	if lLegend is not None and len(lLegend) > 0:
+		if lPalette is None:
+			iBackground, iText = 255, 0
+		else:
+			iBackground, iText = len(lPalette), len(lPalette) + 1
+			lPalette = lPalette + [(255, 255, 255), (0, 0, 0)]
+		lLegendRows = getLegendRows(lLegend, iBackground, iText)
+		iImageWidth = max(iWidth, len(lLegendRows[0]))
+		iImageHeight += len(lLegendRows)
+		sPadding = chr(iBackground) * (iImageWidth - iWidth)
+	else:
+		lLegendRows = list()
+		sPadding = ""
+
+	def getRows():
+		for iY in range(iHeight - 1, -1, -1):
+			sRow = array.array('B', getRow(iY)).tostring()
+			if bPrintMapPreview:
+				print sRow.translate(sTable)
+			yield sRow + sPadding
+		for sLegendRow in lLegendRows:
+			yield sLegendRow + chr(iBackground) * (iImageWidth - len(sLegendRow))
+
+	sFileName = sName.lower().replace(" ", "_") + ".png"
+	writePNG(os.path.join(sMapPreviewDirectory, sFileName), iImageWidth, iImageHeight, getRows(), lPalette, sComment)
+
+
+def getLegendRows(lLines, iBackground, iText):
+	"""
+	Draws lines of text with dLegendFont, to be added below a PNG map preview. Each line is 5 pixels high, with a
+	margin of 1 pixel around it, and each character is 3 pixels wide plus 1 pixel of spacing.
+	:param lLines: List of lines of text.
+	:param iBackground: Pixel value of the background.
+	:param iText: Pixel value of the text.
+	:return: List of byte strings with the pixels of each row, from top to bottom. All rows have the same length.
+	"""
+	iLength = max([len(sLine) for sLine in lLines])
+	sBackground = chr(iBackground)
+	# Each of the 8 possible rows of a character, with its spacing.
+	lGlyphRows = list()
+	for iBits in range(8):
+		lPixels = [sBackground] * 4
+		for iPixel in range(3):
+			if iBits & (4 >> iPixel):
+				lPixels[iPixel] = chr(iText)
+		lGlyphRows.append("".join(lPixels))
+
+	iWidth = iLength * 4 + 1
+	lRows = [sBackground * iWidth]
+	for sLine in lLines:
+		lGlyphs = [dLegendFont.get(sCharacter, dLegendFont[" "]) for sCharacter in sLine.upper()]
+		for iGlyphY in range(5):
+			sRow = sBackground + "".join([lGlyphRows[tGlyph[iGlyphY]] for tGlyph in lGlyphs])
+			lRows.append(sRow + sBackground * (iWidth - len(sRow)))
+		lRows.append(sBackground * iWidth)
+
+	return lRows
+
+
+def writePNG(sPath, iWidth, iHeight, lRows, lPalette=None, sComment=None):
+	"""
+	Writes an 8 bit PNG image. The image uses indexed colors if a palette is provided, and greyscale otherwise.
+	:param sPath: Path of the image file.
+	:param iWidth: Width of the image.
+	:param iHeight: Height of the image.
+	:param lRows: Iterable of byte strings with the values of each row of the image, from top to bottom. Rows are
+	compressed as they are obtained.
+	:param lPalette: List of (red, green, blue) tuples with the color of each value, or None.
+	:param sComment: Text stored in the image as a comment, or None.
+	"""
+	def getChunk(sType, sData):
+		sChunk = sType + sData
+		return struct.pack(">I", len(sData)) + sChunk + struct.pack(">I", zlib.crc32(sChunk) & 0xffffffffL)
+
+	if lPalette is None:
+		iColorType = 0
+	else:
+		iColorType = 3
+
+	lChunks = ["\x89PNG\r\n\x1a\n", getChunk("IHDR", struct.pack(">IIBBBBB", iWidth, iHeight, 8, iColorType, 0, 0, 0))]
+	if lPalette is not None:
+		lChunks.append(getChunk("PLTE", "".join([struct.pack("BBB", iRed, iGreen, iBlue) for iRed, iGreen, iBlue in lPalette])))
+	if sComment is not None:
+		lChunks.append(getChunk("tEXt", "Comment\x00" + sComment))
+	# Each scanline starts with its filter type. No filtering is used.
+	compressor = zlib.compressobj()
+	lCompressed = list()
+	for sRow in lRows:
+		lCompressed.append(compressor.compress("\x00" + sRow))
+	lCompressed.append(compressor.flush())
+	lChunks.append(getChunk("IDAT", "".join(lCompressed)))
+	lChunks.append(getChunk("IEND", ""))
+
+	pFile = open(sPath, "wb")
+	try:
+		pFile.write("".join(lChunks))
+	finally:
+		pFile.close()
+
+
+def getRegionTimingsComment(sRegionName=None):
+	"""
+	Describes the timings measured while generating the regions of the map. See bProfileGeneration.
+	:param sRegionName: Only this region will be described. If it is None, all regions are described.
+	:return: String with the timings, or None if they are not available.
+	"""
+	lTimings = getRegionTimingsLegend(sRegionName)
+	if lTimings is None:
+		return None
+
+	if sRegionName is not None:
+		return "Generated in %.1f ms." % (dRegionTimings[sRegionName] * 1000.0)
+	return "Region timings: " + ", ".join(lTimings) + "."
+
+
+def getRegionTimingsLegend(sRegionName=None):
+	"""
+	Lists the timings measured while generating the regions of the map, to be drawn as the legend of a map preview.
+	See bProfileGeneration.
+	:param sRegionName: Only this region will be listed. If it is None, all regions are listed.
+	:return: List with a line for each region, sorted by region name, or None if the timings are not available.
+	"""
+	if not bProfileGeneration:
+		return None
+
+	if sRegionName is not None:
+		if not dRegionTimings.has_key(sRegionName):
+			return None
+		lNames = [sRegionName]
+	else:
+		lNames = dRegionTimings.keys()
+		if len(lNames) == 0:
+			return None
+		lNames.sort()
+
+	return ["%s: %.1f ms" % (sName, dRegionTimings[sName] * 1000.0) for sName in lNames]
+
+
+def previewPlotTypes(plotTypes, iWidth, iHeight):
+	"""
+	Map preview of a list of plot types.
+	:param plotTypes: List of plot types.
+	:param iWidth: Width of the map.
+	:param iHeight: Height of the map.
+	"""
+	dValues = {PlotTypes.PLOT_PEAK: 0, PlotTypes.PLOT_HILLS: 1, PlotTypes.PLOT_LAND: 2, PlotTypes.PLOT_OCEAN: 3}
+
+	def getRow(iY):
+		iStart = iY * iWidth
+		return [dValues[ePlotType] for ePlotType in plotTypes[iStart:iStart + iWidth]]
+
+	lPalette = [(96, 96, 96), (150, 120, 60), (60, 150, 60), (30, 60, 150)]
+	showMapPreview(
+		"Plot types", iWidth, iHeight, getRow, "^n#~", lPalette, getRegionTimingsComment(), getRegionTimingsLegend()
+	)
+
+
+def previewMapArea(mapArea):
+	"""
+	Map preview of the inside matrix of a map area polygon.
+	:param mapArea: Polygonal shape to preview.
+	:type mapArea: MapAreaPolygon
+	"""
+	def getRow(iRegionY):
+		return [int(bInside) for bInside in mapArea.getInsideRow(iRegionY)]
+
+	sComment = "Bounding box starts at (%.1f, %.1f)." % (mapArea.fMinX, mapArea.fMinY)
+	sTimings = getRegionTimingsComment(mapArea.sRegionName)
+	if sTimings is not None:
+		sComment += " " + sTimings
+
+	showMapPreview(
+		mapArea.sRegionName + " region", mapArea.iRegionWidth, mapArea.iRegionHeight, getRow, " #",
+		[(0, 0, 0), (255, 255, 255)], sComment, getRegionTimingsLegend(mapArea.sRegionName)
+	)
+
+
+def previewLatitude(sName, lLatitudeRows):
+	"""
+	Map preview of the latitude of each plot.
+	:param sName: Name of the preview.
+	:param lLatitudeRows: Rows of latitudes returned by getLatitudeRows.
+	"""
+	def getRow(iY):
+		return [int(fLatitude * 255) for fLatitude in lLatitudeRows[iY]]
+
+	showMapPreview(sName, map.getGridWidth(), map.getGridHeight(), getRow, " .:-=+*#%@")
+
+
+def previewFractal(sName, fractal):
+	"""
+	Map preview of the heights of a fractal with the same size as the map.
+	:param sName: Name of the preview.
+	:param fractal: Fractal to preview.
+	"""
+	iWidth = map.getGridWidth()
+
+	def getRow(iY):
+		return [fractal.getHeight(iX, iY) for iX in range(iWidth)]
+
+	showMapPreview(sName, iWidth, map.getGridHeight(), getRow, " .:-=+*#%@")
+
+
+def labelLandmassRuns(lRows):
+	"""
+	Labels all connected landmasses of a grid. Plots are connected to their eight neighbors, like areas in Civilization
+	IV. Each row is split into runs of land plots, and runs of consecutive rows that touch, also diagonally, are joined
+	with a union-find forest of labels. This runs in linear time, and only the runs are processed one by one.
+	:param lRows: List of byte strings with the plot types of each row. All rows must have the same length.
+	:return: Tuple with a list with the runs of each row, as (first x, last x, label) tuples, and a dictionary with the
+	number of plots of each landmass, indexed by label.
+	"""
+	sOcean = chr(int(PlotTypes.PLOT_OCEAN))
+	lParents = list()
+
+	def find(iLabel):
+		iRoot = iLabel
+		while lParents[iRoot] != iRoot:
+			iRoot = lParents[iRoot]
+		# Path compression.
+		while lParents[iLabel] != iRoot:
+			iNext = lParents[iLabel]
+			lParents[iLabel] = iRoot
+			iLabel = iNext
+		return iRoot
+
+	lRowRuns = list()
+	lPreviousRuns = list()
+	for sRow in lRows:
+		lRuns = list()
+		iX = 0
+		iPrevious = 0
+		for sRun in sRow.split(sOcean):
+			if len(sRun) > 0:
+				iFirstX = iX
+				iLastX = iX + len(sRun) - 1
+				# Skip the runs of the previous row that end before this one can touch them.
+				while iPrevious < len(lPreviousRuns) and lPreviousRuns[iPrevious][1] < iFirstX - 1:
+					iPrevious += 1
+				iLabel = -1
+				iOther = iPrevious
+				while iOther < len(lPreviousRuns) and lPreviousRuns[iOther][0] <= iLastX + 1:
+					iOtherLabel = find(lPreviousRuns[iOther][2])
+					if iLabel < 0:
+						iLabel = iOtherLabel
+					elif iOtherLabel != iLabel:
+						# Merge both landmasses, keeping the lowest label as the root.
+						iLabel, iOtherLabel = min(iLabel, iOtherLabel), max(iLabel, iOtherLabel)
+						lParents[iOtherLabel] = iLabel
+					iOther += 1
+				if iLabel < 0:
+					iLabel = len(lParents)
+					lParents.append(iLabel)
+				lRuns.append((iFirstX, iLastX, iLabel))
+			iX += len(sRun) + 1
+		lRowRuns.append(lRuns)
+		lPreviousRuns = lRuns
+
+	dSizes = dict()
+	for iRow in range(len(lRowRuns)):
+		lRuns = list()
+		for iFirstX, iLastX, iLabel in lRowRuns[iRow]:
+			iLabel = find(iLabel)
+			lRuns.append((iFirstX, iLastX, iLabel))
+			dSizes[iLabel] = dSizes.get(iLabel, 0) + iLastX - iFirstX + 1
+		lRowRuns[iRow] = lRuns
+
+	return lRowRuns, dSizes
+
+
+def labelLandmasses(plotTypes, iWidth, iHeight):
+	"""
+	Labels all connected landmasses of a list of plot types. See labelLandmassRuns.
+	:param plotTypes: List of plot types.
+	:param iWidth: Width of the map.
+	:param iHeight: Height of the map.
+	:return: Tuple with the list of landmass labels of each plot (-1 for water) and a dictionary with the number of plots
+	of each landmass, indexed by label.
+	"""
+	lRows = [array.array('B', plotTypes[iY * iWidth:(iY + 1) * iWidth]).tostring() for iY in range(iHeight)]
+	lRowRuns, dSizes = labelLandmassRuns(lRows)
+
+	lLabels = [-1] * (iWidth * iHeight)
+	for iY in range(iHeight):
+		iRowStart = iY * iWidth
+		for iFirstX, iLastX, iLabel in lRowRuns[iY]:
+			lLabels[iRowStart + iFirstX:iRowStart + iLastX + 1] = [iLabel] * (iLastX - iFirstX + 1)
+
+	return lLabels, dSizes
+
+
+def getMapAreaPlots(mapArea, iWidth, iHeight):
+	"""
+	Finds the plots of the bounding box of a map area polygon that are inside of the disc, and those that are also
+	inside of the polygon. They only depend on the polygon, so they can be reused while its region is generated again.
+	:param mapArea: Polygonal shape to check.
+	:type mapArea: MapAreaPolygon
+	:param iWidth: Width of the map.
+	:param iHeight: Height of the map.
+	:return: Tuple with the x and y coordinates of the bounding box in the map, its width, its height, a list with the
+	first and last x coordinates of each row of the box inside of the disc, relative to the box, and a list with a row
+	for each row of the box, in which plots inside of the polygon and of the disc are 1 and the rest are 0.
+	"""
+	iMinX = max(0, int(mapArea.fMinX))
+	iMinY = max(0, int(mapArea.fMinY))
+	iMaxX = min(iWidth, int(mapArea.fMinX) + mapArea.iRegionWidth)
+	iMaxY = min(iHeight, int(mapArea.fMinY) + mapArea.iRegionHeight)
+	iBoxWidth = max(0, iMaxX - iMinX)
+	iBoxHeight = max(0, iMaxY - iMinY)
+
+	# Columns of the inside matrix of each column of the box, as calculated by MapAreaPolygon.isInside. Columns outside
+	# of the matrix use an additional column that is always outside of the polygon.
+	lRegionColumns = list()
+	for iX in range(iMinX, iMaxX):
+		iRegionX = int(iX - mapArea.fMinX)
+		if iRegionX < 0 or iRegionX >= mapArea.iRegionWidth:
+			iRegionX = mapArea.iRegionWidth
+		lRegionColumns.append(iRegionX)
+
+	lDiscSpans = list()
+	lInsideRows = list()
+	for iY in range(iMinY, iMaxY):
+		iFirstX, iLastX = getDiscRowSpan(iY, iWidth, iHeight)
+		iFirstBoxX = min(iBoxWidth, max(0, iFirstX - iMinX))
+		iLastBoxX = max(iFirstBoxX - 1, min(iBoxWidth - 1, iLastX - iMinX))
+		lDiscSpans.append((iFirstBoxX, iLastBoxX))
+
+		lRow = [0] * iBoxWidth
+		iRegionY = int(iY - mapArea.fMinY)
+		if iRegionY >= 0 and iRegionY < mapArea.iRegionHeight:
+			lInsideRow = mapArea.getInsideRow(iRegionY) + [False]
+			lRow[iFirstBoxX:iLastBoxX + 1] = [
+				int(lInsideRow[iRegionX]) for iRegionX in lRegionColumns[iFirstBoxX:iLastBoxX + 1]
+			]
+		lInsideRows.append(lRow)
+
+	return iMinX, iMinY, iBoxWidth, iBoxHeight, lDiscSpans, lInsideRows
+
+
+def getMapAreaLandmasses(mapArea, plotTypes, iWidth, iHeight, tAreaPlots=None):
+	"""
+	Finds the landmasses inside of a map area polygon. Only the bounding box of the polygon is labeled, and plots
+	outside of the disc are considered water.
+	:param mapArea: Polygonal shape to check.
+	:type mapArea: MapAreaPolygon
+	:param plotTypes: List of plot types of the whole map.
+	:param iWidth: Width of the map.
+	:param iHeight: Height of the map.
+	:param tAreaPlots: Plots of the polygon, as returned by getMapAreaPlots. By default, they are obtained again.
+	:return: Tuple with the number of plots inside of the polygon and a list with the number of plots of each landmass
+	that are inside of the polygon, sorted from the biggest to the smallest.
+	"""
+	if tAreaPlots is None:
+		tAreaPlots = getMapAreaPlots(mapArea, iWidth, iHeight)
+	iMinX, iMinY, iBoxWidth, iBoxHeight, lDiscSpans, lInsideRows = tAreaPlots
+
+	# Copy the rows of the bounding box, removing the land outside of the disc.
+	sOcean = chr(int(PlotTypes.PLOT_OCEAN))
+	lRows = list()
+	for iBoxY in range(iBoxHeight):
+		iFirstBoxX, iLastBoxX = lDiscSpans[iBoxY]
+		iStart = (iBoxY + iMinY) * iWidth + iMinX
+		sRow = array.array('B', plotTypes[iStart + iFirstBoxX:iStart + iLastBoxX + 1]).tostring()
+		lRows.append(sOcean * iFirstBoxX + sRow + sOcean * (iBoxWidth - iLastBoxX - 1))
+
+	lRowRuns, dSizes = labelLandmassRuns(lRows)
+
+	iAreaPlots = 0
+	dInsideSizes = dict()
+	for iBoxY in range(iBoxHeight):
+		lInsideRow = lInsideRows[iBoxY]
+		iAreaPlots += sum(lInsideRow)
+		for iFirstX, iLastX, iLabel in lRowRuns[iBoxY]:
+			iInside = sum(lInsideRow[iFirstX:iLastX + 1])
+			if iInside > 0:
+				dInsideSizes[iLabel] = dInsideSizes.get(iLabel, 0) + iInside
+
+	lLandmasses = dInsideSizes.values()
+	lLandmasses.sort()
+	lLandmasses.reverse()
+	return iAreaPlots, lLandmasses
+
+
+def getSeededDice(iSeed):
+	"""
+	Creates the random number generators used to generate the plot types of a specific seed.
+	:param iSeed: Seed.
+	:return: Tuple with the random number generator for fractals and the one for the layout of the regions.
+	"""
+	fracDice = CyRandom()
+	fracDice.init(iSeed)
+	layoutDice = CyRandom()
+	layoutDice.init(iSeed + 1)
+	return fracDice, layoutDice
+
+
+def saveGenerationState():
+	"""
+	Copies the module state filled in by the generation of a map, so that it can be restored after generating plots
+	outside of the map generation.
+	:return: Tuple with the saved state, to be passed to restoreGenerationState.
+	"""
+	return (
+		list(lStartingPlotAreas), list(lMapAreas), dRegionTimings.copy(), sharedDisplacementFractals, distanceFields
+	)
+
+
+def restoreGenerationState(tState):
+	"""
+	Restores the module state saved by saveGenerationState. The lists and the dictionary are restored in place, as
+	other modules may keep references to them.
+	:param tState: Tuple returned by saveGenerationState.
+	"""
+	global sharedDisplacementFractals
+	global distanceFields
+	lSavedStartingPlotAreas, lSavedMapAreas, dSavedRegionTimings, sharedDisplacementFractals, distanceFields = tState
+	lStartingPlotAreas[:] = lSavedStartingPlotAreas
+	lMapAreas[:] = lSavedMapAreas
+	dRegionTimings.clear()
+	dRegionTimings.update(dSavedRegionTimings)
+
+
+def screenSeed(iSeed, fScale=-1.0):
+	"""
+	Generates the plot types of a seed in a scaled down grid, to estimate quickly the land balance of its regions.
+	The regions keep the same geometry and angles as in a full size generation of the same seed (see iGenerationSeed),
+	so seeds can be discarded before spending time on them.
+	Regions that do not pass the landmass check are not generated again while screening. A scaled down region is too
+	small for this check, and each retry would change the fractals of the rest of the regions. The reported values are
+	those of the first attempt, like in the full size generation when its regions pass the check.
+	The regions of the map, its region timings and its shared displacement fractals are restored before returning.
+	:param iSeed: Seed to screen.
+	:param fScale: Scale of the grid with regard to the size of the map. By default, fScreeningScale.
+	:return: Dictionary indexed by region name. Each value is a dictionary with the fraction of the region covered by
+	land (fLandFraction), the fraction covered by its largest landmass (fLargestLandmassFraction), the estimated size of
+	the largest landmass at full size (iLargestLandmassPlots) and if civilizations can start in it (bStartingArea).
+	"""
+	if fScale <= 0.0:
+		fScale = fScreeningScale
+
+	tState = saveGenerationState()
+	try:
+		fracDice, layoutDice = getSeededDice(iSeed)
+		plotGenerator = DiscworldMultilayeredFractal(fScale, fracDice, layoutDice, 0)
+		plotTypes = plotGenerator.generatePlotsByRegion()
+		removeLandOutsideDisc(plotTypes, plotGenerator.iW, plotGenerator.iH)
+
+		dRegions = dict()
+		for mapArea in lMapAreas:
+			iAreaPlots, lLandmasses = getMapAreaLandmasses(mapArea, plotTypes, plotGenerator.iW, plotGenerator.iH)
+			fLandFraction = 0.0
+			fLargestLandmassFraction = 0.0
+			iLargestLandmassPlots = 0
+			if iAreaPlots > 0 and len(lLandmasses) > 0:
+				fLandFraction = sum(lLandmasses) / float(iAreaPlots)
+				fLargestLandmassFraction = lLandmasses[0] / float(iAreaPlots)
+				iLargestLandmassPlots = int(lLandmasses[0] / (fScale * fScale))
+
+			dRegions[mapArea.sRegionName] = {
+				"fLandFraction": fLandFraction,
+				"fLargestLandmassFraction": fLargestLandmassFraction,
+				"iLargestLandmassPlots": iLargestLandmassPlots,
+				"bStartingArea": mapArea in lStartingPlotAreas,
+			}
+	finally:
+		restoreGenerationState(tState)
+
+	return dRegions
+
+
+def getGrowthExponent(lSizes, lTimes):
+	"""
+	Fits the empirical growth exponent of a series of timings, as the slope of the least squares line of log(time)
+	against log(size).
+	:param lSizes: List of problem sizes.
+	:param lTimes: List of times in seconds, one for each size.
+	:return: Growth exponent. 1.0 means linear growth.
+	"""
+	lLogSizes = [math.log(iSize) for iSize in lSizes]
+	# Very fast stages can be measured as 0.0 seconds.
+	lLogTimes = [math.log(max(fTime, 1e-6)) for fTime in lTimes]
+	fMeanSize = sum(lLogSizes) / len(lLogSizes)
+	fMeanTime = sum(lLogTimes) / len(lLogTimes)
+
+	fCovariance = 0.0
+	fVariance = 0.0
+	for iIndex in range(len(lLogSizes)):
+		fCovariance += (lLogSizes[iIndex] - fMeanSize) * (lLogTimes[iIndex] - fMeanTime)
+		fVariance += (lLogSizes[iIndex] - fMeanSize) * (lLogSizes[iIndex] - fMeanSize)
+
+	if fVariance == 0.0:
+		return 0.0
+	return fCovariance / fVariance
+
+
+def checkComplexityScaling(lScales=(0.25, 0.5, 1.0, 2.0), lVertexCounts=(4, 8, 16, 32), lPlayerCounts=(2, 4, 8, 16),
+                           iBonusesPerType=1, iRepetitions=3, fTolerance=0.3):
+	"""
+	Measures how the time spent in each stage of the generation grows with the size of its input, and checks it
+	against the complexity budget of the stage. Map stages are measured on a series of grids scaled from the size of
+	the map, using the same seed, and the polygon checks on regular polygons with a series of vertex counts. Each
+	measurement is repeated and the fastest time is used, with the garbage collector disabled, as its cost depends on
+	all the objects of the game instead of the measured stage. Results are printed to the log.
+	The starting plots are found with findStartingPlot on the map for a series of player counts and of starting region
+	counts. Bonuses are placed with DiscworldBonusScalingGenerator on bands of rows of the map with heights scaled like
+	the grids, up to the height of the map, with a fixed number of bonuses of each type.
+	The regions of the map, its region timings and its shared displacement fractals are restored before returning. The
+	map must have its terrain and features generated.
+	:param lScales: Scales of the grids, with regard to the size of the map.
+	:param lVertexCounts: Number of vertices of the polygons.
+	:param lPlayerCounts: Number of players, and number of starting regions, of the starting plot checks.
+	:param iBonusesPerType: Number of bonuses of each type placed in each band.
+	:param iRepetitions: Number of times each measurement is repeated.
+	:param fTolerance: Growth exponents can exceed their budget by this amount.
+	:return: List with the names of the stages that exceeded their budget.
+	"""
+	tState = saveGenerationState()
+	try:
+		lStages = getComplexityScalingStages(lScales, lVertexCounts, lPlayerCounts, iBonusesPerType, tState)
+
+		lFailedStages = list()
+		for sName, fBudget, lParameters, lSizes, timeStage in lStages:
+			lTimes = list()
+			for parameter in lParameters:
+				gc.disable()
+				try:
+					lTimes.append(min([timeStage(parameter) for iRepetition in range(iRepetitions)]))
+				finally:
+					gc.enable()
+			fExponent = getGrowthExponent(lSizes, lTimes)
+
+			sResult = "passed"
+			if fExponent > fBudget + fTolerance:
+				sResult = "FAILED"
+				lFailedStages.append(sName)
+			print "[DISCWORLD] -- %s: growth exponent %.2f, budget %.2f: %s." % (sName, fExponent, fBudget, sResult)
+	finally:
+		restoreGenerationState(tState)
+
+	return lFailedStages
+
+
+def getComplexityScalingStages(lScales, lVertexCounts, lPlayerCounts, iBonusesPerType, tState):
+	"""
+	Creates the stages measured by checkComplexityScaling.
+	:param lScales: Scales of the grids, with regard to the size of the map.
+	:param lVertexCounts: Number of vertices of the polygons.
+	:param lPlayerCounts: Number of players, and number of starting regions, of the starting plot checks.
+	:param iBonusesPerType: Number of bonuses of each type placed in each band.
+	:param tState: State of the map returned by saveGenerationState.
+	:return: List of stages. Each stage has a name, a budget, the parameters and problem sizes of each measurement and
+	a function that receives a parameter and returns the time it takes. Budgets are the maximum growth exponent.
+	"""
+	# Regions are generated without retries, so that all measurements do the same work.
+	dPlotTypes = dict()
+
+	def getPlotTypes(fScale):
+		if not dPlotTypes.has_key(fScale):
+			fracDice, layoutDice = getSeededDice(0)
+			plotGenerator = DiscworldMultilayeredFractal(fScale, fracDice, layoutDice, 0)
+			plotTypes = plotGenerator.generatePlotsByRegion()
+			removeLandOutsideDisc(plotTypes, plotGenerator.iW, plotGenerator.iH)
+			dPlotTypes[fScale] = (plotTypes, plotGenerator.iW, plotGenerator.iH, list(lStartingPlotAreas))
+		return dPlotTypes[fScale]
+
+	def timeRegions(fScale):
+		fracDice, layoutDice = getSeededDice(0)
+		plotGenerator = DiscworldMultilayeredFractal(fScale, fracDice, layoutDice, 0)
+		fStartTime = time.clock()
+		plotGenerator.generatePlotsByRegion()
+		return time.clock() - fStartTime
+
+	def timeValidation(fScale):
+		plotTypes, iWidth, iHeight, lAreas = getPlotTypes(fScale)
+		fStartTime = time.clock()
+		for mapArea in lAreas:
+			getMapAreaLandmasses(mapArea, plotTypes, iWidth, iHeight)
+		return time.clock() - fStartTime
+
+	def timeBorder(fScale):
+		plotTypes, iWidth, iHeight, lAreas = getPlotTypes(fScale)
+		fStartTime = time.clock()
+		removeLandOutsideDisc(plotTypes[:], iWidth, iHeight)
+		return time.clock() - fStartTime
+
+	# The latitude of terrain and features is read by their generators from the rows of getLatitudeRows.
+	def timeLatitude(fScale):
+		plotTypes, iWidth, iHeight, lAreas = getPlotTypes(fScale)
+		fracDice, layoutDice = getSeededDice(0)
+		terrainFractal = getVariationFractal(iTerrainGrain, iWidth, iHeight, fracDice)
+		featuresFractal = getVariationFractal(iFeatureGrain, iWidth, iHeight, fracDice)
+		fStartTime = time.clock()
+		getLatitudeRows(terrainFractal, iWidth, iHeight)
+		getLatitudeRows(featuresFractal, iWidth, iHeight)
+		return time.clock() - fStartTime
+
+	def timeLandmasses(fScale):
+		plotTypes, iWidth, iHeight, lAreas = getPlotTypes(fScale)
+		fStartTime = time.clock()
+		labelLandmasses(plotTypes, iWidth, iHeight)
+		return time.clock() - fStartTime
+
+	def timeDistanceFields(fScale):
+		plotTypes, iWidth, iHeight, lAreas = getPlotTypes(fScale)
+		fStartTime = time.clock()
+		fields = DiscworldDistanceFields(plotTypes, iWidth, iHeight)
+		fields.getDistanceToCoast(0, 0)
+		fields.getDistanceToRim(0, 0)
+		fields.getDistanceToHub(0, 0)
+		return time.clock() - fStartTime
+
+	def timePolygon(iVertices):
+		fMiddleX = map.getGridWidth() / 2.0
+		fMiddleY = map.getGridHeight() / 2.0
+		fRadius = map.getGridWidth() / 4.0
+		lPoints = list()
+		for iVertex in range(iVertices):
+			fAngle = 2.0 * math.pi * iVertex / iVertices
+			lPoints.append([fMiddleX + fRadius * math.cos(fAngle), fMiddleY + fRadius * math.sin(fAngle)])
+		fracDice, layoutDice = getSeededDice(0)
+		fStartTime = time.clock()
+		MapAreaPolygon("Scaling check", lPoints, 0.0, fracDice = fracDice, layoutDice = layoutDice)
+		return time.clock() - fStartTime
+
+	# Starting plots are found on the map, with its own starting regions.
+	globalContext = CyGlobalContext()
+	lPlayers = [
+		iPlayer for iPlayer in range(globalContext.getMAX_CIV_PLAYERS()) if globalContext.getPlayer(iPlayer).isAlive()
+	]
+	lPlayableAreas = tState[0]
+
+	def timeStartingPlayers(iPlayers):
+		lStartingPlotAreas[:] = lPlayableAreas
+		fStartTime = time.clock()
+		for iPlayer in range(iPlayers):
+			findStartingPlot([lPlayers[iPlayer % len(lPlayers)]])
+		return time.clock() - fStartTime
+
+	def timeStartingRegions(iRegions):
+		lStartingPlotAreas[:] = [lPlayableAreas[iRegion % len(lPlayableAreas)] for iRegion in range(iRegions)]
+		fStartTime = time.clock()
+		findStartingPlot([lPlayers[0]])
+		return time.clock() - fStartTime
+
+	# Only the time spent placing bonuses is measured for each band, not the one spent indexing it. Placing a fixed
+	# number of bonuses should not depend on the size of the band.
+	lBonuses = [
+		iBonus for iBonus in range(globalContext.getNumBonusInfos())
+		if globalContext.getBonusInfo(iBonus).getPlacementOrder() >= 0
+	]
+	lBandHeights = list()
+	for fScale in lScales:
+		if fScale <= 1.0:
+			lBandHeights.append(max(1, int(map.getGridHeight() * fScale)))
+
+	def getBonusGenerator(iBandHeight):
+		fracDice, layoutDice = getSeededDice(0)
+		return DiscworldBonusScalingGenerator(iBandHeight, iBonusesPerType, fracDice)
+
+	def timeBonusIndex(iBandHeight):
+		bonusGen = getBonusGenerator(iBandHeight)
+		fStartTime = time.clock()
+		bonusGen.buildPlotIndex()
+		return time.clock() - fStartTime
+
+	# Placing a few bonuses is fast, so each measurement places them with several generators.
+	def timeBonusPlacement(iBandHeight):
+		lBonusGens = list()
+		for iRun in range(32):
+			bonusGen = getBonusGenerator(iBandHeight)
+			bonusGen.buildPlotIndex()
+			lBonusGens.append(bonusGen)
+		fStartTime = time.clock()
+		for bonusGen in lBonusGens:
+			for iBonus in lBonuses:
+				bonusGen.addBonusType(iBonus)
+		return time.clock() - fStartTime
+
+	# The size of each band is the number of plots that it indexes or that already have a bonus.
+	lBandPlots = list()
+	for iBandHeight in lBandHeights:
+		bonusGen = getBonusGenerator(iBandHeight)
+		bonusGen.buildPlotIndex()
+		lBandPlots.append(max(1, bonusGen.getNumIndexedPlots(bonusGen.dPlotIndex.keys()) + sum(bonusGen.lNumBonuses)))
+
+	lGridSizes = [getPlotTypes(fScale)[1] * getPlotTypes(fScale)[2] for fScale in lScales]
+	lStages = [
+		("Region generation", 1.0, lScales, lGridSizes, timeRegions),
+		("Region validation", 1.0, lScales, lGridSizes, timeValidation),
+		("Disc border", 1.0, lScales, lGridSizes, timeBorder),
+		("Latitude", 1.0, lScales, lGridSizes, timeLatitude),
+		("Landmass labeling", 1.0, lScales, lGridSizes, timeLandmasses),
+		("Distance fields", 1.0, lScales, lGridSizes, timeDistanceFields),
+		("Polygon vertices", 1.0, lVertexCounts, lVertexCounts, timePolygon),
+		("Bonus index", 1.0, lBandHeights, lBandPlots, timeBonusIndex),
+		("Bonus placement", 0.0, lBandHeights, lBandPlots, timeBonusPlacement),
+	]
+	if len(lPlayers) > 0 and len(lPlayableAreas) > 0:
+		lStages.append(("Starting plot players", 1.0, lPlayerCounts, lPlayerCounts, timeStartingPlayers))
+		lStages.append(("Starting plot regions", 1.0, lPlayerCounts, lPlayerCounts, timeStartingRegions))
+
+	return lStages